@@ -1,156 +1,303 @@
-import copy
 import random
+import time
+from const import *
 from board import Board
+from bitboard import BitBoard
 from move import Move
 from square import Square
 from piece import *
-
-# Piece values for evaluation
-PIECE_VALUES = {
-    'pawn': 100,
-    'knight': 320,
-    'bishop': 330,
-    'rook': 500,
-    'queen': 900,
-    'king': 20000
-}
-
-# Piece-square tables (for white, flip for black)
-PAWN_TABLE = [
-    [0,  0,  0,  0,  0,  0,  0,  0],
-    [50, 50, 50, 50, 50, 50, 50, 50],
-    [10, 10, 20, 30, 30, 20, 10, 10],
-    [5,  5, 10, 25, 25, 10,  5,  5],
-    [0,  0,  0, 20, 20,  0,  0,  0],
-    [5, -5,-10,  0,  0,-10, -5,  5],
-    [5, 10, 10,-20,-20, 10, 10,  5],
-    [0,  0,  0,  0,  0,  0,  0,  0]
-]
-
-KNIGHT_TABLE = [
-    [-50,-40,-30,-30,-30,-30,-40,-50],
-    [-40,-20,  0,  0,  0,  0,-20,-40],
-    [-30,  0, 10, 15, 15, 10,  0,-30],
-    [-30,  5, 15, 20, 20, 15,  5,-30],
-    [-30,  0, 15, 20, 20, 15,  0,-30],
-    [-30,  5, 10, 15, 15, 10,  5,-30],
-    [-40,-20,  0,  5,  5,  0,-20,-40],
-    [-50,-40,-30,-30,-30,-30,-40,-50]
-]
-
-BISHOP_TABLE = [
-    [-20,-10,-10,-10,-10,-10,-10,-20],
-    [-10,  0,  0,  0,  0,  0,  0,-10],
-    [-10,  0,  5, 10, 10,  5,  0,-10],
-    [-10,  5,  5, 10, 10,  5,  5,-10],
-    [-10,  0, 10, 10, 10, 10,  0,-10],
-    [-10, 10, 10, 10, 10, 10, 10,-10],
-    [-10,  5,  0,  0,  0,  0,  5,-10],
-    [-20,-10,-10,-10,-10,-10,-10,-20]
-]
-
-ROOK_TABLE = [
-    [0,  0,  0,  0,  0,  0,  0,  0],
-    [5, 10, 10, 10, 10, 10, 10,  5],
-    [-5,  0,  0,  0,  0,  0,  0, -5],
-    [-5,  0,  0,  0,  0,  0,  0, -5],
-    [-5,  0,  0,  0,  0,  0,  0, -5],
-    [-5,  0,  0,  0,  0,  0,  0, -5],
-    [-5,  0,  0,  0,  0,  0,  0, -5],
-    [0,  0,  0,  5,  5,  0,  0,  0]
-]
-
-QUEEN_TABLE = [
-    [-20,-10,-10, -5, -5,-10,-10,-20],
-    [-10,  0,  0,  0,  0,  0,  0,-10],
-    [-10,  0,  5,  5,  5,  5,  0,-10],
-    [-5,  0,  5,  5,  5,  5,  0, -5],
-    [0,  0,  5,  5,  5,  5,  0, -5],
-    [-10,  5,  5,  5,  5,  5,  0,-10],
-    [-10,  0,  5,  0,  0,  0,  0,-10],
-    [-20,-10,-10, -5, -5,-10,-10,-20]
-]
-
-KING_TABLE = [
-    [-30,-40,-40,-50,-50,-40,-40,-30],
-    [-30,-40,-40,-50,-50,-40,-40,-30],
-    [-30,-40,-40,-50,-50,-40,-40,-30],
-    [-30,-40,-40,-50,-50,-40,-40,-30],
-    [-20,-30,-30,-40,-40,-30,-30,-20],
-    [-10,-20,-20,-20,-20,-20,-20,-10],
-    [20, 20,  0,  0,  0,  0, 20, 20],
-    [20, 30, 10,  0,  0, 10, 30, 20]
-]
-
-PIECE_TABLES = {
-    'pawn': PAWN_TABLE,
-    'knight': KNIGHT_TABLE,
-    'bishop': BISHOP_TABLE,
-    'rook': ROOK_TABLE,
-    'queen': QUEEN_TABLE,
-    'king': KING_TABLE
-}
+from evaluation import *
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from book import book_move
+from tablebase import tablebases, MAX_PIECES
 
 def evaluate_board(board, color):
     """
     Evaluate the board position for the given color.
     Positive score means advantage for the color.
-    Optimized for speed - only material and position for now.
-    """
-    score = 0
-    
-    # Material and position evaluation
-    for row in range(8):
-        for col in range(8):
-            piece = board.squares[row][col].piece
-            if piece:
-                value = PIECE_VALUES[piece.name.lower()]
-                table = PIECE_TABLES[piece.name.lower()]
-                if piece.color == 'white':
-                    pos_value = table[row][col]
-                else:
-                    pos_value = table[7 - row][col]  # Flip for black
-                total_value = value + pos_value
-                if piece.color == color:
-                    score += total_value
-                else:
-                    score -= total_value
-    
-    return score
+    Material and position are kept up to date by the board on every move, so this is O(1).
+    Endgames covered by the tablebases (tablebase.py) are scored by their distance to mate instead.
+    """
+    if AI_USE_TABLEBASES and board.piece_count <= MAX_PIECES:
+        score = tablebases.score(board, color)
+        if score is not None:
+            return score
+    return board.score if color == 'white' else -board.score
 
 def get_all_moves(board, color):
     """
     Get all legal moves for the given color.
     """
-    moves = []
-    for row in range(8):
-        for col in range(8):
-            if board.squares[row][col].has_piece() and board.squares[row][col].piece.color == color:
-                piece = board.squares[row][col].piece
-                board.calc_moves(piece, row, col, bool=True)
-                moves.extend(piece.moves)
-    return moves
+    return board.legal_moves(color)
+
+def get_all_captures(board, color):
+    """
+    Get all legal captures for the given color, most valuable victim / least valuable attacker first.
+    """
+    captures = [m for m in board.legal_moves(color) if board.is_capture(m)]
+    captures.sort(key=lambda m: mvv_lva(board, m), reverse=True)
+    return captures
+
+def mvv_lva(board, move):
+    """
+    Capture ordering key: most valuable victim first, then least valuable attacker.
+    """
+    victim = board.piece_name(move.final.row, move.final.col) or 'pawn'  # en passant
+    attacker = board.piece_name(move.initial.row, move.initial.col)
+    return PIECE_VALUES[victim], -PIECE_VALUES[attacker]
+
+# Position backends the engine can search on, see AI_BACKEND
+BACKENDS = {'board': Board, 'bitboard': BitBoard}
+
+def search_board(fen, backend=AI_BACKEND):
+    """
+    Position to search in the engine and worker processes, on the backend set by AI_BACKEND.
+    """
+    return BACKENDS[backend](fen)
+
+# Remembered between sibling subtrees and between consecutive AI turns
+transposition_table = TranspositionTable()
+
+# Bound as seen from the other side (a lower bound for one side is an upper bound for the other)
+FLIPPED_BOUND = {EXACT: EXACT, LOWER: UPPER, UPPER: LOWER}
+
+class SearchTimeout(Exception):
+    """
+    Raised inside minimax when the time budget of get_best_move is spent or the search is stopped.
+    """
+
+# Time and stop requests are checked once every this many nodes
+NODE_CHECK_INTERVAL = 512
+nodes_searched = 0
+
+def check_limits(deadline, stop):
+    """
+    Count a node and, every NODE_CHECK_INTERVAL nodes, abort the search if the deadline
+    has passed or stop (any object with is_set(), such as a threading.Event) is set.
+    """
+    global nodes_searched
+    nodes_searched += 1
+    if nodes_searched % NODE_CHECK_INTERVAL == 0:
+        if (deadline and time.perf_counter() > deadline) or (stop and stop.is_set()):
+            raise SearchTimeout()
+
+# Killer moves: per ply, the last two quiet moves that caused a beta cutoff
+MAX_PLY = 64
+killer_moves = [[None, None] for _ in range(MAX_PLY)]
+
+# History heuristic: butterfly table of cutoff counts, history[color][from_square][to_square]
+history = {color: [[0] * 64 for _ in range(64)] for color in ('white', 'black')}
+
+def record_cutoff(board, move, color, depth, ply):
+    """
+    Remember a quiet move that caused a beta cutoff in the killer slots and the history table.
+    """
+    if board.is_capture(move):
+        return
+    code = move.encode()
+    killers = killer_moves[min(ply, MAX_PLY - 1)]
+    if killers[0] != code:
+        killers[1] = killers[0]
+        killers[0] = code
+    # squares only, the promotion piece in the high bits of the code isn't part of the butterfly index
+    history[color][move.initial.row * 8 + move.initial.col][move.final.row * 8 + move.final.col] += depth * depth
+
+def clear_heuristics():
+    """
+    Forget the killers of the previous search and age the history table.
+    """
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+    for table in history.values():
+        for row in table:
+            for to in range(64):
+                row[to] //= 2
+
+def exchange_value(board, move):
+    """
+    Static exchange value of a capture (Board.see). A capture of a piece worth at least the capturing
+    piece can't lose material, so then the exchange isn't resolved and the difference in value,
+    a lower bound, is returned instead.
+    """
+    victim = board.piece_name(move.final.row, move.final.col) or 'pawn'  # en passant
+    attacker = board.piece_name(move.initial.row, move.initial.col)
+    if PIECE_VALUES[victim] >= PIECE_VALUES[attacker] and not move.promotion:
+        return PIECE_VALUES[victim] - PIECE_VALUES[attacker]
+    return board.see(move)
+
+def pick_moves(board, moves, color, ply, pv_move=None, tt_move=None, prune_below=None):
+    """
+    Staged move picker: principal variation and table move, then captures that don't lose material
+    by MVV-LVA, then killer moves, then quiet moves by history score, then losing captures by
+    static exchange value. Losing captures worth less than prune_below are skipped altogether,
+    unless no other move is left to search.
+    Moves are picked one at a time, so a cutoff stops the ordering work early.
+    """
+    done = set()
+
+    # stage 1: best moves of the previous iteration / transposition table
+    for code in (pv_move, tt_move):
+        if code is not None and code not in done:
+            for move in moves:
+                if move.encode() == code:
+                    done.add(code)
+                    yield move
+                    break
+
+    captures = []
+    losing = []
+    quiets = []
+    for move in moves:
+        if move.encode() in done:
+            continue
+        if board.is_capture(move):
+            value = exchange_value(board, move)
+            if value < 0:
+                losing.append((value, move))
+            else:
+                captures.append(move)
+        else:
+            quiets.append(move)
+
+    # stage 2: captures, best MVV-LVA first
+    scores = [mvv_lva(board, move) for move in captures]
+    while captures:
+        best = max(range(len(captures)), key=scores.__getitem__)
+        scores.pop(best)
+        yield captures.pop(best)
+
+    # stage 3: killer moves
+    killers = killer_moves[min(ply, MAX_PLY - 1)]
+    for code in killers:
+        if code is not None:
+            for i, move in enumerate(quiets):
+                if move.encode() == code:
+                    yield quiets.pop(i)
+                    break
+
+    # stage 4: quiet moves, best history score first
+    table = history[color]
+    scores = [table[move.initial.row * 8 + move.initial.col][move.final.row * 8 + move.final.col] for move in quiets]
+    while quiets:
+        best = max(range(len(quiets)), key=scores.__getitem__)
+        scores.pop(best)
+        yield quiets.pop(best)
+
+    # stage 5: losing captures, least losing first
+    searched = len(moves) - len(losing)
+    losing.sort(key=lambda item: item[0], reverse=True)
+    for value, move in losing:
+        if prune_below is not None and value < prune_below and searched:
+            break
+        searched += 1
+        yield move
+
+# Delta pruning: a capture is skipped when even winning the victim plus this margin can't reach alpha
+DELTA_MARGIN = 200
+
+# Losing captures are pruned in the last SEE_PRUNE_DEPTH plies before the horizon
+# when they lose more than SEE_PRUNE_MARGIN per remaining ply, and always in the quiescence search
+SEE_PRUNE_DEPTH = 2
+SEE_PRUNE_MARGIN = 100
+
+def quiescence(board, alpha, beta, maximizing_player, color, deadline=None, stop=None):
+    """
+    Capture-only search at the horizon, so positions are only evaluated once they are quiet.
+    Uses the static evaluation as a stand-pat score; a side in check searches all its evasions instead.
+    """
+    check_limits(deadline, stop)
+
+    side = color if maximizing_player else ('white' if color == 'black' else 'black')
+    in_check = board.is_in_check(side)
+
+    if in_check:
+        moves = get_all_moves(board, side)
+        if not moves:
+            return -float('inf') if maximizing_player else float('inf')
+        best = -float('inf') if maximizing_player else float('inf')
+    else:
+        # stand pat: the side to move can always decline to capture
+        best = evaluate_board(board, color)
+        if maximizing_player:
+            if best >= beta:
+                return best
+            alpha = max(alpha, best)
+        else:
+            if best <= alpha:
+                return best
+            beta = min(beta, best)
+        moves = get_all_captures(board, side)
+
+    for move in moves:
+        if not in_check:
+            gain = PIECE_VALUES[board.piece_name(move.final.row, move.final.col) or 'pawn'] + DELTA_MARGIN
+            if maximizing_player and best + gain <= alpha:
+                continue
+            if not maximizing_player and best - gain >= beta:
+                continue
+            # a capture that loses material by static exchange can't improve on standing pat
+            if exchange_value(board, move) < 0:
+                continue
 
-def minimax(board, depth, alpha, beta, maximizing_player, color):
+        board.make_move(move)
+        score = quiescence(board, alpha, beta, not maximizing_player, color, deadline, stop)
+        board.unmake_move()
+
+        if maximizing_player:
+            best = max(best, score)
+            alpha = max(alpha, score)
+        else:
+            best = min(best, score)
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+
+    return best
+
+def minimax(board, depth, alpha, beta, maximizing_player, color, ply=0, pv=None, deadline=None, stop=None):
     """
-    Minimax algorithm with alpha-beta pruning.
+    Minimax algorithm with alpha-beta pruning and a transposition table.
+    pv holds the move codes of the previous iteration's principal variation,
+    deadline is a time.perf_counter() value after which the search is aborted,
+    and the search is also aborted once stop.is_set() returns True.
     """
     if depth == 0:
-        return evaluate_board(board, color), None
+        return quiescence(board, alpha, beta, maximizing_player, color, deadline, stop), None
+
+    check_limits(deadline, stop)
+
+    # Transposition table lookup (scores are stored from the side to move's point of view)
+    key = board.hash
+    tt_move = None
+    entry = transposition_table.probe(key)
+    if entry:
+        tt_move = entry[4]
+        if ply > 0 and entry[1] >= depth:
+            tt_score, tt_bound = entry[2], entry[3]
+            if not maximizing_player:
+                tt_score, tt_bound = -tt_score, FLIPPED_BOUND[tt_bound]
+            if tt_bound == EXACT:
+                return tt_score, None
+            if tt_bound == LOWER and tt_score >= beta:
+                return tt_score, None
+            if tt_bound == UPPER and tt_score <= alpha:
+                return tt_score, None
+
+    alpha_orig, beta_orig = alpha, beta
+
+    pv_move = pv[ply] if pv and ply < len(pv) else None
+    prune_below = -SEE_PRUNE_MARGIN * depth if ply > 0 and depth <= SEE_PRUNE_DEPTH else None
 
     if maximizing_player:
         max_eval = -float('inf')
         best_move = None
         best_moves = []  # Track all moves with the best score
         moves = get_all_moves(board, color)
-        # Sort moves: captures first (simple heuristic)
-        moves.sort(key=lambda m: 1 if board.squares[m.final.row][m.final.col].has_piece() else 0, reverse=True)
-        for move in moves:
-            # Make a copy of the board
-            temp_board = copy.deepcopy(board)
-            temp_piece = temp_board.squares[move.initial.row][move.initial.col].piece
-            temp_board.move(temp_piece, move, testing=True)
-            eval_score, _ = minimax(temp_board, depth - 1, alpha, beta, False, color)
+        for move in pick_moves(board, moves, color, ply, pv_move, tt_move, prune_below):
+            # Play the move in place and take it back afterwards
+            board.make_move(move)
+            eval_score, _ = minimax(board, depth - 1, alpha, beta, False, color, ply + 1, pv, deadline, stop)
+            board.unmake_move()
             if eval_score > max_eval:
                 max_eval = eval_score
                 best_moves = [move]  # New best score, reset list
@@ -158,31 +305,147 @@ def minimax(board, depth, alpha, beta, maximizing_player, color):
                 best_moves.append(move)  # Equal score, add to list
             alpha = max(alpha, eval_score)
             if beta <= alpha:
+                record_cutoff(board, move, color, depth, ply)
                 break
         # Randomly choose among equally good moves to avoid repetition
         best_move = random.choice(best_moves) if best_moves else None
-        return max_eval, best_move
+        best_eval = max_eval
     else:
         min_eval = float('inf')
+        best_move = None
         opponent_color = 'white' if color == 'black' else 'black'
         moves = get_all_moves(board, opponent_color)
-        moves.sort(key=lambda m: 1 if board.squares[m.final.row][m.final.col].has_piece() else 0, reverse=True)
-        for move in moves:
-            temp_board = copy.deepcopy(board)
-            temp_piece = temp_board.squares[move.initial.row][move.initial.col].piece
-            temp_board.move(temp_piece, move, testing=True)
-            eval_score, _ = minimax(temp_board, depth - 1, alpha, beta, True, color)
-            min_eval = min(min_eval, eval_score)
+        for move in pick_moves(board, moves, opponent_color, ply, pv_move, tt_move, prune_below):
+            board.make_move(move)
+            eval_score, _ = minimax(board, depth - 1, alpha, beta, True, color, ply + 1, pv, deadline, stop)
+            board.unmake_move()
+            if eval_score < min_eval:
+                min_eval = eval_score
+                best_move = move
             beta = min(beta, eval_score)
             if beta <= alpha:
+                record_cutoff(board, move, opponent_color, depth, ply)
                 break
-        return min_eval, None
+        best_eval = min_eval
+
+    # Transposition table store
+    if best_eval <= alpha_orig:
+        bound = UPPER
+    elif best_eval >= beta_orig:
+        bound = LOWER
+    else:
+        bound = EXACT
+    tt_score = best_eval
+    if not maximizing_player:
+        tt_score, bound = -tt_score, FLIPPED_BOUND[bound]
+    transposition_table.store(key, depth, tt_score, bound, best_move.encode() if best_move else None)
 
-def get_best_move(board, color, depth=2):
+    if maximizing_player:
+        return max_eval, best_move
+    return min_eval, None
+
+def get_principal_variation(board, color, depth):
     """
-    Get the best move for the given color using Minimax.
-    Single-threaded for optimal performance and responsiveness.
+    Follow the best moves stored in the transposition table from the current position.
     """
-    _, best_move = minimax(board, depth, -float('inf'), float('inf'), True, color)
-    return best_move
+    pv = []
+    side = color
+    for _ in range(depth):
+        entry = transposition_table.probe(board.hash)
+        if not entry or entry[4] is None:
+            break
+        move = next((m for m in get_all_moves(board, side) if m.encode() == entry[4]), None)
+        if move is None:
+            break
+        pv.append(move)
+        board.make_move(move)
+        side = 'white' if side == 'black' else 'black'
+    for _ in pv:
+        board.unmake_move()
+    return pv
+
+def get_best_move(board, color, time_ms=AI_TIME_MS, max_depth=AI_MAX_DEPTH, on_iteration=None, stop=None,
+                  workers=AI_WORKERS, parallel=AI_PARALLEL, use_book=AI_USE_BOOK,
+                  use_tablebases=AI_USE_TABLEBASES):
+    """
+    Get the best move for the given color using iterative deepening Minimax.
+    Searches depth 1, 2, 3... until time_ms is spent (or max_depth is reached) and
+    returns the best move of the deepest completed iteration.
+    on_iteration(depth, score, pv) is called after every completed iteration, pv as a list of moves.
+    Setting stop (an Event-like object) cancels the search; the move of the last completed
+    iteration is returned, or None if not even depth 1 finished.
+    With workers > 1 the search is spread over processes: parallel='root' splits the root moves
+    (parallel.root_pool), 'lazy-smp' runs helpers on a shared transposition table (parallel.smp_pool).
+    Otherwise the search runs single-threaded in this process.
+    A move from the opening book (book.py) is returned without searching at all,
+    and so is the fastest mate (or the best defence) in endgames covered by the tablebases.
+    The root moves come from board.status, shared with the game's end-of-game checks:
+    with no legal move there is nothing to search and a single legal move is played at once.
+    """
+    _, root_moves = board.status(color)
+    if len(root_moves) <= 1:
+        return Move.decode(root_moves[0]) if root_moves else None
+
+    if use_book:
+        move = book_move(board, color)
+        if move:
+            return move
+
+    if use_tablebases and board.piece_count <= MAX_PIECES:
+        move = tablebases.best_move(board, color)
+        if move:
+            return move
 
+    if workers > 1:
+        from parallel import root_pool, smp_pool
+        pool = smp_pool if parallel == 'lazy-smp' else root_pool
+        return pool.search(board, color, time_ms, max_depth, on_iteration, stop, workers=workers)
+
+    transposition_table.new_search()
+    clear_heuristics()
+    root_ply = len(board.undo_stack)
+    pv = []
+
+    def search(depth, deadline):
+        try:
+            score, move = minimax(board, depth, -float('inf'), float('inf'), True, color,
+                                  pv=pv, deadline=deadline, stop=stop)
+        except SearchTimeout:
+            # take back the moves of the interrupted iteration
+            while len(board.undo_stack) > root_ply:
+                board.unmake_move()
+            return None
+        pv_moves = get_principal_variation(board, color, depth) if move else []
+        pv[:] = [m.encode() for m in pv_moves]
+        return score, move, pv_moves
+
+    return iterative_deepening(search, time_ms, max_depth, on_iteration)
+
+def iterative_deepening(search, time_ms, max_depth, on_iteration=None):
+    """
+    Iterative deepening loop of get_best_move and parallel.RootSearchPool.search.
+    search(depth, deadline) runs one iteration and returns (score, best move, pv as a list of moves),
+    or None if it ran past deadline (a time.perf_counter() value) or was stopped.
+    Returns the best move of the deepest completed iteration, or None if not even depth 1 finished.
+    """
+    start = time.perf_counter()
+    deadline = start + time_ms / 1000
+    best_move = None
+
+    for depth in range(1, max_depth + 1):
+        # depth 1 always completes unless stopped, so there is a move to play
+        result = search(depth, deadline if depth > 1 else None)
+        if result is None:
+            break
+        score, move, pv = result
+        if move is None:
+            break
+        best_move = move
+        if on_iteration:
+            on_iteration(depth, score, pv)
+
+        # the next iteration takes longer than this one, don't start it if it can't finish
+        if time.perf_counter() - start > time_ms / 2000:
+            break
+
+    return best_move
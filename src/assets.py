@@ -0,0 +1,54 @@
+import pygame
+import os
+
+# Largest piece images on disk, used as the source for any other size
+SOURCE_SIZE = 128
+
+class Assets:
+
+    def __init__(self):
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.images_dir = os.path.join(base_dir, 'assets', 'images')
+        # (color, name, size) -> converted surface, or None if it could not be loaded
+        self.textures = {}
+
+    def piece_texture(self, color, name, size=80):
+        '''
+            Surface for a piece image of the given size, loaded and converted once, then served from the cache
+        '''
+        key = (color, name, size)
+        if key not in self.textures:
+            self.textures[key] = self._load(color, name, size)
+        return self.textures[key]
+
+    def preload(self, sizes=(80, SOURCE_SIZE)):
+        for color in ('white', 'black'):
+            for name in ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king'):
+                for size in sizes:
+                    self.piece_texture(color, name, size)
+
+    def clear(self):
+        self.textures = {}
+
+    def _path(self, color, name, size):
+        return os.path.join(self.images_dir, f'imgs-{size}px', f'{color}_{name}.png')
+
+    def _load(self, color, name, size):
+        path = self._path(color, name, size)
+        try:
+            if os.path.exists(path):
+                img = pygame.image.load(path)
+            else:
+                # no image of that size on disk: scale the cached source image instead of reading it again
+                source = self.piece_texture(color, name, SOURCE_SIZE)
+                if source is None:
+                    return None
+                return pygame.transform.smoothscale(source, (size, size))
+        except pygame.error:
+            print(f"Warning: Could not load piece image {path}")
+            return None
+        # convert_alpha needs a display; before one exists keep the image as loaded
+        return img.convert_alpha() if pygame.display.get_surface() else img
+
+# Shared by every Game, so the cache survives Game.reset
+assets = Assets()
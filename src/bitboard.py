@@ -0,0 +1,633 @@
+from array import array
+
+from const import *
+from move import Move, PROMOTION_NAMES
+from square import Square, COORDINATES
+from zobrist import PIECE_KEYS, EN_PASSANT_KEYS, SIDE_KEY, castling_key
+from evaluation import PIECE_VALUES, PIECE_SQUARE_VALUES
+
+# Squares are numbered row * 8 + col, row 0 being the 8th rank like Board.squares
+
+# Piece types and colors
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+WHITE, BLACK = 0, 1
+NAMES = ['pawn', 'knight', 'bishop', 'rook', 'queen', 'king']
+COLORS = ['white', 'black']
+FEN_LETTERS = 'pnbrqk'
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+FULL = (1 << 64) - 1
+
+# promotion bits of a move code, queen first
+PROMOTIONS = [QUEEN << 12, ROOK << 12, BISHOP << 12, KNIGHT << 12]
+
+def _on_board(row, col):
+    return 0 <= row < ROWS and 0 <= col < COLS
+
+def _leaper_table(incrs):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        attacks = 0
+        for row_incr, col_incr in incrs:
+            if _on_board(row + row_incr, col + col_incr):
+                attacks |= 1 << ((row + row_incr) * 8 + col + col_incr)
+        table.append(attacks)
+    return table
+
+def _ray_table(row_incr, col_incr):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        ray = 0
+        r, c = row + row_incr, col + col_incr
+        while _on_board(r, c):
+            ray |= 1 << (r * 8 + c)
+            r, c = r + row_incr, c + col_incr
+        table.append(ray)
+    return table
+
+# Precomputed attack tables
+KNIGHT_ATTACKS = _leaper_table(KNIGHT_JUMPS)
+KING_ATTACKS = _leaper_table(KING_STEPS)
+# squares attacked by a pawn of each color standing on a square
+PAWN_ATTACKS = [_leaper_table([(-1, -1), (-1, 1)]), _leaper_table([(1, -1), (1, 1)])]
+
+# Sliding rays; "positive" rays run towards higher square numbers (their first blocker is the lowest bit)
+ROOK_POSITIVE = [_ray_table(1, 0), _ray_table(0, 1)]
+ROOK_NEGATIVE = [_ray_table(-1, 0), _ray_table(0, -1)]
+BISHOP_POSITIVE = [_ray_table(1, 1), _ray_table(1, -1)]
+BISHOP_NEGATIVE = [_ray_table(-1, 1), _ray_table(-1, -1)]
+ROOK_RAYS = [a | b | c | d for a, b, c, d in zip(*ROOK_POSITIVE, *ROOK_NEGATIVE)]
+BISHOP_RAYS = [a | b | c | d for a, b, c, d in zip(*BISHOP_POSITIVE, *BISHOP_NEGATIVE)]
+
+def _between_table():
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        for row_incr, col_incr in KING_STEPS:
+            between = 0
+            r, c = row + row_incr, col + col_incr
+            while _on_board(r, c):
+                table[sq][r * 8 + c] = between
+                between |= 1 << (r * 8 + c)
+                r, c = r + row_incr, c + col_incr
+    return table
+
+# squares strictly in between two aligned squares (0 if they are not aligned)
+BETWEEN = _between_table()
+
+# castling rights kept when a move starts or ends on a square (white kingside, white queenside, black kingside, black queenside)
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[60] &= ~3
+CASTLING_MASK[63] &= ~1
+CASTLING_MASK[56] &= ~2
+CASTLING_MASK[4] &= ~12
+CASTLING_MASK[7] &= ~4
+CASTLING_MASK[0] &= ~8
+
+# zobrist keys by piece index (color * 6 + type), shared with Board so both hash alike
+ZOBRIST = [PIECE_KEYS[COLORS[index // 6]][NAMES[index % 6]] for index in range(12)]
+
+# signed value + position of every piece on every square, by piece index
+PST = [PIECE_SQUARE_VALUES[COLORS[index // 6]][NAMES[index % 6]] for index in range(12)]
+
+# exchange value of every piece type
+VALUES = [PIECE_VALUES[name] for name in NAMES]
+
+# one Square per board square, shared by every Move built for the GUI/AI interface
+SQUARES = COORDINATES
+
+def rook_attacks(sq, occupied):
+    attacks = 0
+    for rays in ROOK_POSITIVE:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in ROOK_NEGATIVE:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+def bishop_attacks(sq, occupied):
+    attacks = 0
+    for rays in BISHOP_POSITIVE:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in BISHOP_NEGATIVE:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+class BitBoard:
+    '''
+        Bitboard position with the same move/FEN interface as Board, so the AI can run on either.
+        Internally moves are ints with the same code as Move.encode: from_square << 6 | to_square,
+        promotion piece type in bits 12-14
+    '''
+
+    STATUS_CACHE_SIZE = 64
+
+    def __init__(self, fen=None):
+        self.bb = [0] * 12          # piece bitboards by piece index (color * 6 + type)
+        self.occ = [0, 0]           # occupancy by color
+        self.mailbox = [None] * 64  # piece index on every square
+        self.side = WHITE
+        self.castling_rights = 0
+        self.ep = -1                # en passant target square
+        self.fullmove = 1
+        self.last_move = None
+        self.undo_stack = []
+        self.status_cache = {}
+        self._load_fen(fen or START_FEN)
+        self.hash = self._compute_hash()
+        self.score = self._compute_score()
+        self.piece_count = bin(self.occ[WHITE] | self.occ[BLACK]).count('1')
+
+    # interface shared with Board
+
+    @property
+    def next_player(self):
+        return COLORS[self.side]
+
+    def legal_moves(self, color):
+        return [Move(SQUARES[code >> 6 & 63], SQUARES[code & 63], PROMOTION_NAMES[code >> 12])
+                for code in self.generate(COLORS.index(color))]
+
+    def legal_codes(self, color):
+        # the generator's own move codes, without building Move objects
+        return array('H', self.generate(COLORS.index(color)))
+
+    def make_move(self, move):
+        self.make(move.encode())
+        self.last_move = move
+
+    def unmake_move(self):
+        self.unmake()
+
+    def is_capture(self, move):
+        to = move.final.row * 8 + move.final.col
+        if self.mailbox[to] is not None:
+            return True
+        frm = move.initial.row * 8 + move.initial.col
+        return to == self.ep and self.mailbox[frm] % 6 == PAWN
+
+    def see(self, move):
+        '''
+            Static exchange evaluation, see Board.see. Captured-with pieces leave the occupancy,
+            so sliders behind them show up as attackers
+        '''
+        code = move.encode()
+        frm, to = code >> 6 & 63, code & 63
+        mailbox = self.mailbox
+        index = mailbox[frm]
+        victim = mailbox[to]
+        occupied = (self.occ[WHITE] | self.occ[BLACK]) ^ (1 << frm)
+        if victim is None and index % 6 == PAWN and to == self.ep:
+            victim_sq = to - (-8 if index < 6 else 8)
+            victim = mailbox[victim_sq]
+            occupied ^= 1 << victim_sq
+        gains = [VALUES[victim % 6] if victim is not None else 0]
+        on_square = VALUES[index % 6]
+        if index % 6 == PAWN and (to < 8 or to >= 56):
+            promoted = VALUES[(code >> 12) or QUEEN]
+            gains[0] += promoted - on_square
+            on_square = promoted
+
+        bb = self.bb
+        side = index // 6 ^ 1
+        while True:
+            attackers = self._attackers(to, side, occupied) & occupied
+            if not attackers:
+                break
+            # least valuable attacker: piece types are in value order
+            for piece_type in range(6):
+                found = attackers & bb[side * 6 + piece_type]
+                if found:
+                    break
+            occupied ^= found & -found
+            # the king can't capture onto a square the other side still attacks
+            if piece_type == KING and self._attackers(to, side ^ 1, occupied) & occupied:
+                break
+            gains.append(on_square - gains[-1])
+            on_square = VALUES[piece_type]
+            side ^= 1
+
+        while len(gains) > 1:
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0]
+
+    def piece_name(self, row, col):
+        index = self.mailbox[row * 8 + col]
+        return None if index is None else NAMES[index % 6]
+
+    def pieces(self):
+        for sq, index in enumerate(self.mailbox):
+            if index is not None:
+                yield sq // 8, sq % 8, NAMES[index % 6], COLORS[index // 6]
+
+    def is_in_check(self, color):
+        us = COLORS.index(color)
+        king = self.bb[us * 6 + KING]
+        if not king:
+            return False
+        return self._attacked(king.bit_length() - 1, us ^ 1, self.occ[0] | self.occ[1])
+
+    def is_square_attacked(self, row, col, by_color):
+        return self._attacked(row * 8 + col, COLORS.index(by_color), self.occ[0] | self.occ[1])
+
+    def status(self, color):
+        # (in check, legal moves), cached by position like Board.status
+        key = (self.hash, color)
+        status = self.status_cache.get(key)
+        if status is None:
+            status = (self.is_in_check(color), self.legal_codes(color))
+            if len(self.status_cache) >= self.STATUS_CACHE_SIZE:
+                del self.status_cache[next(iter(self.status_cache))]
+            self.status_cache[key] = status
+        return status
+
+    def has_legal_moves(self, color):
+        status = self.status_cache.get((self.hash, color))
+        if status is not None:
+            return len(status[1]) > 0
+        return len(self.generate(COLORS.index(color))) > 0
+
+    def is_checkmate(self, color):
+        return self.is_in_check(color) and not self.has_legal_moves(color)
+
+    def is_stalemate(self, color):
+        return not self.is_in_check(color) and not self.has_legal_moves(color)
+
+    def to_fen(self):
+        rows = []
+        for row in range(ROWS):
+            fen_row = ''
+            empty = 0
+            for col in range(COLS):
+                index = self.mailbox[row * 8 + col]
+                if index is None:
+                    empty += 1
+                    continue
+                if empty:
+                    fen_row += str(empty)
+                    empty = 0
+                letter = FEN_LETTERS[index % 6]
+                fen_row += letter.upper() if index < 6 else letter
+            if empty:
+                fen_row += str(empty)
+            rows.append(fen_row)
+
+        castling = ''.join(flag for bit, flag in enumerate('KQkq') if self.castling_rights & (1 << bit)) or '-'
+        en_passant = '-' if self.ep < 0 else Square.get_alphacol(self.ep % 8) + str(ROWS - self.ep // 8)
+        side = 'w' if self.side == WHITE else 'b'
+        return f'{"/".join(rows)} {side} {castling} {en_passant} 0 {self.fullmove}'
+
+    # move generation
+
+    def _attacked(self, sq, by, occupied, removed=0):
+        '''
+            Whether side by attacks sq with the given occupancy (pieces in removed are ignored)
+        '''
+        bb = self.bb
+        o = by * 6
+        if KNIGHT_ATTACKS[sq] & bb[o + KNIGHT]:
+            return True
+        if PAWN_ATTACKS[by ^ 1][sq] & bb[o + PAWN] & ~removed:
+            return True
+        if KING_ATTACKS[sq] & bb[o + KING]:
+            return True
+        rooks = bb[o + ROOK] | bb[o + QUEEN]
+        if rooks & ROOK_RAYS[sq] and rook_attacks(sq, occupied) & rooks:
+            return True
+        bishops = bb[o + BISHOP] | bb[o + QUEEN]
+        if bishops & BISHOP_RAYS[sq] and bishop_attacks(sq, occupied) & bishops:
+            return True
+        return False
+
+    def _attackers(self, sq, by, occupied):
+        bb = self.bb
+        o = by * 6
+        return (KNIGHT_ATTACKS[sq] & bb[o + KNIGHT]) | \
+               (PAWN_ATTACKS[by ^ 1][sq] & bb[o + PAWN]) | \
+               (KING_ATTACKS[sq] & bb[o + KING]) | \
+               (rook_attacks(sq, occupied) & (bb[o + ROOK] | bb[o + QUEEN])) | \
+               (bishop_attacks(sq, occupied) & (bb[o + BISHOP] | bb[o + QUEEN]))
+
+    def generate(self, us=None):
+        '''
+            Legal move codes of side us (the side to move by default), filtered with check and pin masks
+        '''
+        if us is None:
+            us = self.side
+        them = us ^ 1
+        bb = self.bb
+        own = self.occ[us]
+        enemy = self.occ[them]
+        occupied = own | enemy
+        o = us * 6
+        moves = []
+        append = moves.append
+
+        king = bb[o + KING]
+        if not king:
+            return moves
+        ksq = king.bit_length() - 1
+
+        # king moves, probed with the king lifted off the board
+        without_king = occupied ^ king
+        targets = KING_ATTACKS[ksq] & ~own
+        while targets:
+            low = targets & -targets
+            to = low.bit_length() - 1
+            targets ^= low
+            if not self._attacked(to, them, without_king):
+                append(ksq << 6 | to)
+
+        checkers = self._attackers(ksq, them, occupied)
+        if checkers & (checkers - 1):
+            # double check: only the king can move
+            return moves
+        if checkers:
+            mask = checkers | BETWEEN[ksq][checkers.bit_length() - 1]
+        else:
+            mask = FULL
+
+        # pinned pieces and the squares they can still move to
+        pinned = 0
+        pin_masks = {}
+        t = them * 6
+        snipers = (ROOK_RAYS[ksq] & (bb[t + ROOK] | bb[t + QUEEN])) | \
+                  (BISHOP_RAYS[ksq] & (bb[t + BISHOP] | bb[t + QUEEN]))
+        while snipers:
+            low = snipers & -snipers
+            sniper = low.bit_length() - 1
+            snipers ^= low
+            between = BETWEEN[ksq][sniper] & occupied
+            if between and not between & (between - 1) and between & own:
+                pinned |= between
+                pin_masks[between.bit_length() - 1] = BETWEEN[ksq][sniper] | low
+
+        targets_mask = mask & ~own
+
+        # knights (a pinned knight can never move)
+        pieces = bb[o + KNIGHT] & ~pinned
+        while pieces:
+            low = pieces & -pieces
+            frm = low.bit_length() - 1
+            pieces ^= low
+            targets = KNIGHT_ATTACKS[frm] & targets_mask
+            while targets:
+                low = targets & -targets
+                append(frm << 6 | (low.bit_length() - 1))
+                targets ^= low
+
+        # sliding pieces
+        for piece_type, attacks in ((BISHOP, bishop_attacks), (ROOK, rook_attacks), (QUEEN, None)):
+            pieces = bb[o + piece_type]
+            while pieces:
+                low = pieces & -pieces
+                frm = low.bit_length() - 1
+                pieces ^= low
+                if attacks:
+                    targets = attacks(frm, occupied) & targets_mask
+                else:
+                    targets = (rook_attacks(frm, occupied) | bishop_attacks(frm, occupied)) & targets_mask
+                if low & pinned:
+                    targets &= pin_masks[frm]
+                while targets:
+                    low = targets & -targets
+                    append(frm << 6 | (low.bit_length() - 1))
+                    targets ^= low
+
+        # pawns
+        push = -8 if us == WHITE else 8
+        start_row = 6 if us == WHITE else 1
+        ep = self.ep if us == self.side else -1
+        pieces = bb[o + PAWN]
+        while pieces:
+            low = pieces & -pieces
+            frm = low.bit_length() - 1
+            pieces ^= low
+            allowed = mask
+            if low & pinned:
+                allowed &= pin_masks[frm]
+
+            # pushes
+            to = frm + push
+            if not occupied >> to & 1:
+                if allowed >> to & 1:
+                    if to < 8 or to >= 56:
+                        for promotion in PROMOTIONS:
+                            append(promotion | frm << 6 | to)
+                    else:
+                        append(frm << 6 | to)
+                if frm // 8 == start_row:
+                    to += push
+                    if not occupied >> to & 1 and allowed >> to & 1:
+                        append(frm << 6 | to)
+
+            # en passant: both pawns leave the capture rank, so test the king with the new occupancy
+            if ep >= 0 and PAWN_ATTACKS[us][frm] >> ep & 1:
+                captured = 1 << (ep - push)
+                after = (occupied ^ low ^ captured) | (1 << ep)
+                if not self._attacked(ksq, them, after, captured):
+                    append(frm << 6 | ep)
+
+            # captures
+            targets = PAWN_ATTACKS[us][frm] & enemy & allowed
+            while targets:
+                low = targets & -targets
+                to = low.bit_length() - 1
+                targets ^= low
+                if to < 8 or to >= 56:
+                    for promotion in PROMOTIONS:
+                        append(promotion | frm << 6 | to)
+                else:
+                    append(frm << 6 | to)
+
+        # castling: not out of, through or into check
+        if not checkers and self.castling_rights:
+            rights = self.castling_rights >> (2 * us)
+            if rights & 1 and not occupied & (3 << (ksq + 1)) and \
+                    not self._attacked(ksq + 1, them, occupied) and not self._attacked(ksq + 2, them, occupied):
+                append(ksq << 6 | (ksq + 2))
+            if rights & 2 and not occupied & (7 << (ksq - 3)) and \
+                    not self._attacked(ksq - 1, them, occupied) and not self._attacked(ksq - 2, them, occupied):
+                append(ksq << 6 | (ksq - 2))
+
+        return moves
+
+    # make / unmake
+
+    def _put(self, index, sq):
+        bit = 1 << sq
+        self.bb[index] |= bit
+        self.occ[index // 6] |= bit
+        self.mailbox[sq] = index
+
+    def _remove(self, index, sq):
+        bit = 1 << sq
+        self.bb[index] ^= bit
+        self.occ[index // 6] ^= bit
+        self.mailbox[sq] = None
+
+    def make(self, code):
+        frm = code >> 6 & 63
+        to = code & 63
+        mailbox = self.mailbox
+        index = mailbox[frm]
+        captured = mailbox[to]
+        self.undo_stack.append((code, index, captured, self.castling_rights, self.ep, self.hash, self.score,
+                                self.piece_count, self.last_move))
+
+        h = self.hash ^ SIDE_KEY
+        score = self.score
+        if self.ep >= 0:
+            h ^= EN_PASSANT_KEYS[self.ep % 8]
+
+        if captured is not None:
+            self._remove(captured, to)
+            h ^= ZOBRIST[captured][to]
+            score -= PST[captured][to]
+            self.piece_count -= 1
+
+        self._remove(index, frm)
+        h ^= ZOBRIST[index][frm]
+        score -= PST[index][frm]
+        placed = index
+        piece_type = index % 6
+        ep = -1
+
+        if piece_type == PAWN:
+            diff = to - frm
+            # en passant capture
+            if to == self.ep and captured is None:
+                captured_sq = to - (-8 if index < 6 else 8)
+                self._remove(mailbox[captured_sq], captured_sq)
+                h ^= ZOBRIST[index ^ 6][captured_sq]
+                score -= PST[index ^ 6][captured_sq]
+                self.piece_count -= 1
+            # double step
+            elif diff == 16 or diff == -16:
+                ep = frm + diff // 2
+                h ^= EN_PASSANT_KEYS[ep % 8]
+            # promotion (to a queen, unless the code says otherwise)
+            elif to < 8 or to >= 56:
+                placed = index - PAWN + ((code >> 12) or QUEEN)
+
+        elif piece_type == KING and (to - frm == 2 or frm - to == 2):
+            rook_from, rook_to = (frm + 3, frm + 1) if to > frm else (frm - 4, frm - 1)
+            rook = index - KING + ROOK
+            self._remove(rook, rook_from)
+            self._put(rook, rook_to)
+            h ^= ZOBRIST[rook][rook_from] ^ ZOBRIST[rook][rook_to]
+            score += PST[rook][rook_to] - PST[rook][rook_from]
+
+        self._put(placed, to)
+        h ^= ZOBRIST[placed][to]
+        score += PST[placed][to]
+
+        rights = self.castling_rights & CASTLING_MASK[frm] & CASTLING_MASK[to]
+        if rights != self.castling_rights:
+            h ^= castling_key(self.castling_rights ^ rights)
+            self.castling_rights = rights
+
+        self.ep = ep
+        self.hash = h
+        self.score = score
+        if self.side == BLACK:
+            self.fullmove += 1
+        self.side ^= 1
+
+    def unmake(self):
+        (code, index, captured, self.castling_rights, ep, self.hash, self.score,
+         self.piece_count, self.last_move) = self.undo_stack.pop()
+        frm = code >> 6 & 63
+        to = code & 63
+        self.side ^= 1
+        if self.side == BLACK:
+            self.fullmove -= 1
+
+        self._remove(self.mailbox[to], to)
+        self._put(index, frm)
+        if captured is not None:
+            self._put(captured, to)
+
+        piece_type = index % 6
+        if piece_type == PAWN and to == ep:
+            captured_sq = to - (-8 if index < 6 else 8)
+            self._put(index ^ 6, captured_sq)
+        elif piece_type == KING and (to - frm == 2 or frm - to == 2):
+            rook_from, rook_to = (frm + 3, frm + 1) if to > frm else (frm - 4, frm - 1)
+            rook = index - KING + ROOK
+            self._remove(rook, rook_to)
+            self._put(rook, rook_from)
+
+        self.ep = ep
+
+    def perft(self, depth):
+        '''
+            Number of leaf nodes of the legal move tree, on the internal int moves
+        '''
+        moves = self.generate()
+        if depth <= 1:
+            return len(moves) if depth == 1 else 1
+        nodes = 0
+        for code in moves:
+            self.make(code)
+            nodes += self.perft(depth - 1)
+            self.unmake()
+        return nodes
+
+    # setup
+
+    def _load_fen(self, fen):
+        fields = fen.split()
+        for row, fen_row in enumerate(fields[0].split('/')):
+            col = 0
+            for char in fen_row:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                index = FEN_LETTERS.index(char.lower()) + (6 if char.islower() else 0)
+                self._put(index, row * 8 + col)
+                col += 1
+
+        self.side = WHITE if len(fields) < 2 or fields[1] == 'w' else BLACK
+        castling = fields[2] if len(fields) > 2 else '-'
+        self.castling_rights = sum(1 << bit for bit, flag in enumerate('KQkq') if flag in castling)
+        if len(fields) > 3 and fields[3] != '-':
+            self.ep = (ROWS - int(fields[3][1])) * 8 + Square.get_col(fields[3][0])
+        self.fullmove = int(fields[5]) if len(fields) > 5 else 1
+
+    def _compute_score(self):
+        score = 0
+        for sq, index in enumerate(self.mailbox):
+            if index is not None:
+                score += PST[index][sq]
+        return score
+
+    def _compute_hash(self):
+        h = 0
+        for sq, index in enumerate(self.mailbox):
+            if index is not None:
+                h ^= ZOBRIST[index][sq]
+        h ^= castling_key(self.castling_rights)
+        if self.ep >= 0:
+            h ^= EN_PASSANT_KEYS[self.ep % 8]
+        if self.side == BLACK:
+            h ^= SIDE_KEY
+        return h
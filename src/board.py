@@ -1,141 +1,451 @@
 from const import *
 from square import Square
 from piece import *
-from move import Move
+from move import Move, encode_moves, decode_moves
 from sound import Sound
-import copy
+from zobrist import PIECE_KEYS, EN_PASSANT_KEYS, SIDE_KEY, castling_key
+from evaluation import PIECE_VALUES, PIECE_SQUARE_VALUES
 import os
 
 class Board:
 
-    def __init__(self):
+    FEN_PIECES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+    PROMOTIONS = {'queen': Queen, 'rook': Rook, 'bishop': Bishop, 'knight': Knight}
+    # positions kept by status(): the game only revisits the last few
+    STATUS_CACHE_SIZE = 64
+
+    def __init__(self, fen=None):
         self.squares = [[0, 0, 0, 0, 0, 0, 0, 0] for col in range(COLS)]
         self.last_move = None
+        self.next_player = 'white'
+        self.en_passant_pawn = None
+        self.en_passant_col = None
+        self.fullmove = 1
+        self.undo_stack = []
+        self.status_cache = {}
+        # legal moves of the side to move by origin square, see legal_move_map
+        self.move_map = None
         self._create()
-        self._add_pieces('white')
-        self._add_pieces('black')
+        if fen:
+            self._load_fen(fen)
+        else:
+            self._add_pieces('white')
+            self._add_pieces('black')
+        self._index_pieces()
+        self.castling_rights = self._castling_rights()
+        self.hash = self._compute_hash()
+        self.score = self._compute_score()
+        # pieces of both colors, kings included, so endgame code can check for few pieces cheaply
+        self.piece_count = len(self.piece_squares['white']) + len(self.piece_squares['black'])
 
     def move(self, piece, move, testing=False):
         initial = move.initial
         final = move.final
 
         en_passant_empty = self.squares[final.row][final.col].isempty()
+        en_passant = isinstance(piece, Pawn) and final.col != initial.col and en_passant_empty
 
         # console board move update
-        self.squares[initial.row][initial.col].piece = None
-        self.squares[final.row][final.col].piece = piece
+        self.make_move(move)
+        # the move map belongs to the previous turn
+        self.move_map = None
+
+        # en passant capture
+        if en_passant and not testing:
+            sound = Sound(
+                os.path.join('assets/sounds/capture.wav'))
+            sound.play()
+
+        # clear valid moves
+        piece.clear_moves()
+
+    def make_move(self, move):
+        '''
+            Play a move on the board and push a compact undo record,
+            so the search can take it back with unmake_move instead of copying the board
+        '''
+        initial = move.initial
+        final = move.final
+        piece = self.squares[initial.row][initial.col].piece
+        captured = self.squares[final.row][final.col].piece
+        captured_row = final.row
+        rook = None
+        promoted = False
 
         if isinstance(piece, Pawn):
             # en passant capture
-            diff = final.col - initial.col
-            if diff != 0 and en_passant_empty:
-                # console board move update
-                self.squares[initial.row][initial.col + diff].piece = None
-                self.squares[final.row][final.col].piece = piece
-                if not testing:
-                    sound = Sound(
-                        os.path.join('assets/sounds/capture.wav'))
-                    sound.play()
-            
+            if captured is None and final.col != initial.col:
+                captured_row = initial.row
+                captured = self.squares[captured_row][final.col].piece
+                self.squares[captured_row][final.col].piece = None
+
             # pawn promotion
-            else:
-                self.check_promotion(piece, final)
+            promoted = final.row == 0 or final.row == 7
+
+        # console board move update
+        self.squares[initial.row][initial.col].piece = None
+        self.squares[final.row][final.col].piece = piece
+        if promoted:
+            self.check_promotion(piece, final, move.promotion or 'queen')
 
         # king castling
+        if isinstance(piece, King) and self.castling(initial, final):
+            rook_col, rook_final_col = (0, 3) if final.col < initial.col else (7, 5)
+            rook = self.squares[initial.row][rook_col].piece
+            self.squares[initial.row][rook_col].piece = None
+            self.squares[initial.row][rook_final_col].piece = rook
+            rook.moved = True
+
+        # zobrist hash and material/position score: side to move, moved piece, capture and castling rook
+        initial_sq = initial.row * 8 + initial.col
+        final_sq = final.row * 8 + final.col
+        h = self.hash ^ SIDE_KEY
+        h ^= PIECE_KEYS[piece.color][piece.name][initial_sq]
+        score = self.score - PIECE_SQUARE_VALUES[piece.color][piece.name][initial_sq]
+        placed = self.squares[final.row][final.col].piece
+        h ^= PIECE_KEYS[placed.color][placed.name][final_sq]
+        score += PIECE_SQUARE_VALUES[placed.color][placed.name][final_sq]
+        own = self.piece_squares[piece.color]
+        own.remove(initial_sq)
+        own.add(final_sq)
         if isinstance(piece, King):
-            if self.castling(initial, final) and not testing:
-                diff = final.col - initial.col
-                rook = piece.left_rook if (diff < 0) else piece.right_rook
-                self.move(rook, rook.moves[-1])
+            self.king_squares[piece.color] = (final.row, final.col)
+        if captured:
+            captured_sq = captured_row * 8 + final.col
+            h ^= PIECE_KEYS[captured.color][captured.name][captured_sq]
+            score -= PIECE_SQUARE_VALUES[captured.color][captured.name][captured_sq]
+            self.piece_squares[captured.color].remove(captured_sq)
+        if rook:
+            rook_sq = initial.row * 8 + rook_col
+            rook_final_sq = initial.row * 8 + rook_final_col
+            own.remove(rook_sq)
+            own.add(rook_final_sq)
+            h ^= PIECE_KEYS[rook.color]['rook'][rook_sq] ^ PIECE_KEYS[rook.color]['rook'][rook_final_sq]
+            values = PIECE_SQUARE_VALUES[rook.color]['rook']
+            score += values[rook_final_sq] - values[rook_sq]
+
+        # en passant state: only a pawn that just made a double step can be taken
+        en_passant_pawn = self.en_passant_pawn
+        en_passant_col = self.en_passant_col
+        if en_passant_pawn:
+            en_passant_pawn.en_passant = False
+            h ^= EN_PASSANT_KEYS[en_passant_col]
+        self.en_passant_pawn = None
+        self.en_passant_col = None
+        if isinstance(piece, Pawn) and abs(final.row - initial.row) == 2:
+            piece.en_passant = True
+            self.en_passant_pawn = piece
+            self.en_passant_col = final.col
+            h ^= EN_PASSANT_KEYS[final.col]
+
+        self.undo_stack.append((move, piece, captured, captured_row, piece.moved,
+                                en_passant_pawn, en_passant_col, rook, promoted,
+                                self.last_move, self.hash, self.score, self.piece_count, self.castling_rights))
 
         # move
         piece.moved = True
 
-        # clear valid moves
-        piece.clear_moves()
+        # castling rights only change when a king or rook moves or a rook is taken
+        if isinstance(piece, (King, Rook)) or isinstance(captured, Rook):
+            rights = self._castling_rights()
+            if rights != self.castling_rights:
+                h ^= castling_key(self.castling_rights ^ rights)
+                self.castling_rights = rights
+
+        self.hash = h
+        self.score = score
+        if captured:
+            self.piece_count -= 1
+        self.next_player = 'white' if self.next_player == 'black' else 'black'
+        if piece.color == 'black':
+            self.fullmove += 1
 
         # set last move
         self.last_move = move
 
-    def valid_move(self, piece, move):
-        return move in piece.moves
+    def unmake_move(self):
+        '''
+            Take back the last move played with make_move
+        '''
+        (move, piece, captured, captured_row, moved,
+         en_passant_pawn, en_passant_col, rook, promoted,
+         last_move, self.hash, self.score, self.piece_count, self.castling_rights) = self.undo_stack.pop()
+        initial = move.initial
+        final = move.final
 
-    def check_promotion(self, piece, final):
-        if final.row == 0 or final.row == 7:
-            self.squares[final.row][final.col].piece = Queen(piece.color)
+        # console board move update
+        self.squares[final.row][final.col].piece = None
+        self.squares[captured_row][final.col].piece = captured
+        self.squares[initial.row][initial.col].piece = piece
+        own = self.piece_squares[piece.color]
+        own.remove(final.row * 8 + final.col)
+        own.add(initial.row * 8 + initial.col)
+        if isinstance(piece, King):
+            self.king_squares[piece.color] = (initial.row, initial.col)
+        if captured:
+            self.piece_squares[captured.color].add(captured_row * 8 + final.col)
 
-    def castling(self, initial, final):
-        return abs(initial.col - final.col) == 2
+        # king castling
+        if rook:
+            rook_col, rook_final_col = (0, 3) if final.col < initial.col else (7, 5)
+            self.squares[initial.row][rook_final_col].piece = None
+            self.squares[initial.row][rook_col].piece = rook
+            own.remove(initial.row * 8 + rook_final_col)
+            own.add(initial.row * 8 + rook_col)
+            rook.moved = False
+
+        # en passant state
+        if isinstance(piece, Pawn):
+            piece.en_passant = False
+        if en_passant_pawn:
+            en_passant_pawn.en_passant = True
+        self.en_passant_pawn = en_passant_pawn
+        self.en_passant_col = en_passant_col
+
+        piece.moved = moved
+        self.last_move = last_move
+        self.next_player = 'white' if self.next_player == 'black' else 'black'
+        if piece.color == 'black':
+            self.fullmove -= 1
+
+    def is_capture(self, move):
+        final = move.final
+        if self.squares[final.row][final.col].has_piece():
+            return True
+        # en passant
+        piece = self.squares[move.initial.row][move.initial.col].piece
+        return isinstance(piece, Pawn) and final.col != move.initial.col
 
-    def set_true_en_passant(self, piece):
-        
-        if not isinstance(piece, Pawn):
-            return
+    def see(self, move):
+        '''
+            Static exchange evaluation: material (PIECE_VALUES) won by the side playing the move once both sides
+            have recaptured on the target square with their least valuable attacker, x-ray attackers included,
+            each side free to stop recapturing when that would lose material. Pins and checks are ignored
+        '''
+        initial, final = move.initial, move.final
+        piece = self.squares[initial.row][initial.col].piece
+        victim = self.squares[final.row][final.col].piece
+        # pieces that have captured are lifted off the board, so the pieces behind them attack next
+        lifted = [(initial.row, initial.col, piece)]
+        if victim is None and isinstance(piece, Pawn) and final.col != initial.col:
+            # en passant: the victim is beside the target square
+            victim = self.squares[initial.row][final.col].piece
+            lifted.append((initial.row, final.col, victim))
+        gains = [PIECE_VALUES[victim.name] if victim else 0]
+        on_square = PIECE_VALUES[piece.name]
+        if isinstance(piece, Pawn) and (final.row == 0 or final.row == 7):
+            promoted = PIECE_VALUES[move.promotion or 'queen']
+            gains[0] += promoted - on_square
+            on_square = promoted
+        for row, col, _ in lifted:
+            self.squares[row][col].piece = None
+
+        side = 'white' if piece.color == 'black' else 'black'
+        while True:
+            attackers = self._attackers(final.row, final.col, side)
+            if not attackers:
+                break
+            row, col = min(attackers, key=lambda sq: PIECE_VALUES[self.squares[sq[0]][sq[1]].piece.name])
+            attacker = self.squares[row][col].piece
+            self.squares[row][col].piece = None
+            lifted.append((row, col, attacker))
+            other = 'white' if side == 'black' else 'black'
+            # the king can't capture onto a square the other side still attacks
+            if isinstance(attacker, King) and self._attackers(final.row, final.col, other):
+                break
+            gains.append(on_square - gains[-1])
+            on_square = PIECE_VALUES[attacker.name]
+            side = other
+
+        for row, col, lifted_piece in lifted:
+            self.squares[row][col].piece = lifted_piece
+        # from the last capture back: each side only recaptures when it doesn't lose by it
+        while len(gains) > 1:
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0]
+
+    def piece_name(self, row, col):
+        piece = self.squares[row][col].piece
+        return piece.name if piece else None
+
+    def pieces(self):
+        '''
+            (row, col, name, color) of every piece on the board, in board order
+        '''
+        for sq in sorted(self.piece_squares['white'] | self.piece_squares['black']):
+            row, col = divmod(sq, 8)
+            piece = self.squares[row][col].piece
+            yield row, col, piece.name, piece.color
 
+    def to_fen(self):
+        '''
+            FEN string of the position (the halfmove clock is not tracked and always 0)
+        '''
+        rows = []
         for row in range(ROWS):
+            fen_row = ''
+            empty = 0
             for col in range(COLS):
-                if isinstance(self.squares[row][col].piece, Pawn):
-                    self.squares[row][col].piece.en_passant = False
-        
-        piece.en_passant = True
+                piece = self.squares[row][col].piece
+                if piece:
+                    if empty:
+                        fen_row += str(empty)
+                        empty = 0
+                    letter = 'n' if piece.name == 'knight' else piece.name[0]
+                    fen_row += letter.upper() if piece.color == 'white' else letter
+                else:
+                    empty += 1
+            if empty:
+                fen_row += str(empty)
+            rows.append(fen_row)
+
+        castling = ''.join(flag for bit, flag in enumerate('KQkq') if self.castling_rights & (1 << bit)) or '-'
+
+        en_passant = '-'
+        if self.en_passant_pawn:
+            row = 5 if self.en_passant_pawn.color == 'white' else 2
+            en_passant = Square.get_alphacol(self.en_passant_col) + str(ROWS - row)
+
+        side = 'w' if self.next_player == 'white' else 'b'
+        return f'{"/".join(rows)} {side} {castling} {en_passant} 0 {self.fullmove}'
+
+    def valid_move(self, piece, move):
+        moves = self.legal_move_map(piece.color).get((move.initial.row, move.initial.col))
+        return bool(moves) and (move.final.row, move.final.col, move.promotion) in moves
+
+    def legal_move_map(self, color):
+        '''
+            Legal moves of a color by origin square: {(row, col): {(final row, final col, promotion): move}}.
+            Built from status() once per turn, so the UI looks moves up without generating any;
+            move() drops it, and it is rebuilt if the position or color changed in between
+        '''
+        if self.move_map is None or self.move_map[0] != (self.hash, color):
+            by_square = {}
+            for move in decode_moves(self.status(color)[1]):
+                final = move.final
+                by_square.setdefault((move.initial.row, move.initial.col), {})[(final.row, final.col, move.promotion)] = move
+            self.move_map = ((self.hash, color), by_square)
+        return self.move_map[1]
+
+    def moves_from(self, row, col):
+        '''
+            Legal moves of the piece on (row, col), from the move map
+        '''
+        piece = self.squares[row][col].piece
+        if not piece:
+            return []
+        return list(self.legal_move_map(piece.color).get((row, col), {}).values())
+
+    def check_promotion(self, piece, final, promotion='queen'):
+        if final.row == 0 or final.row == 7:
+            self.squares[final.row][final.col].piece = self.PROMOTIONS[promotion](piece.color)
+
+    def castling(self, initial, final):
+        return abs(initial.col - final.col) == 2
 
     def in_check(self, piece, move):
-        temp_piece = copy.deepcopy(piece)
-        temp_board = copy.deepcopy(self)
-        temp_board.move(temp_piece, move, testing=True)
-        
-        for row in range(ROWS):
-            for col in range(COLS):
-                if temp_board.squares[row][col].has_enemy_piece(piece.color):
-                    p = temp_board.squares[row][col].piece
-                    temp_board.calc_moves(p, row, col, bool=False)
-                    for m in p.moves:
-                        if isinstance(m.final.piece, King):
-                            return True
-        
-        return False
+        self.make_move(move)
+        check = self.is_in_check(piece.color)
+        self.unmake_move()
+        return check
 
     def is_in_check(self, color):
         """
         Check if the king of the given color is in check.
         """
-        king_square = None
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.squares[row][col].piece
-                if isinstance(piece, King) and piece.color == color:
-                    king_square = (row, col)
-                    break
-            if king_square:
-                break
-        
+        king_square = self._king_square(color)
         if not king_square:
             return False  # Should not happen
-        
+
         # Check if any enemy piece can attack the king
         enemy_color = 'white' if color == 'black' else 'black'
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.squares[row][col].piece
-                if piece and piece.color == enemy_color:
-                    self.calc_moves(piece, row, col, bool=False)
-                    for move in piece.moves:
-                        if move.final.row == king_square[0] and move.final.col == king_square[1]:
+        return self.is_square_attacked(king_square[0], king_square[1], enemy_color)
+
+    def is_square_attacked(self, row, col, by_color):
+        """
+        Check if any piece of by_color attacks the square (row, col).
+        Probes outward from the square and stops at the first attacker.
+        """
+        squares = self.squares
+
+        # knights
+        for row_incr, col_incr in KNIGHT_JUMPS:
+            r, c = row + row_incr, col + col_incr
+            if 0 <= r < ROWS and 0 <= c < COLS:
+                p = squares[r][c].piece
+                if p and p.color == by_color and isinstance(p, Knight):
+                    return True
+
+        # pawns (a pawn of by_color attacks forward diagonally)
+        r = row + (1 if by_color == 'white' else -1)
+        if 0 <= r < ROWS:
+            for c in (col - 1, col + 1):
+                if 0 <= c < COLS:
+                    p = squares[r][c].piece
+                    if p and p.color == by_color and isinstance(p, Pawn):
+                        return True
+
+        # king
+        for row_incr, col_incr in KING_STEPS:
+            r, c = row + row_incr, col + col_incr
+            if 0 <= r < ROWS and 0 <= c < COLS:
+                p = squares[r][c].piece
+                if p and p.color == by_color and isinstance(p, King):
+                    return True
+
+        # sliding pieces
+        for incrs, slider in ((STRAIGHTS, Rook), (DIAGONALS, Bishop)):
+            for row_incr, col_incr in incrs:
+                r, c = row + row_incr, col + col_incr
+                while 0 <= r < ROWS and 0 <= c < COLS:
+                    p = squares[r][c].piece
+                    if p:
+                        if p.color == by_color and isinstance(p, (slider, Queen)):
                             return True
+                        break
+                    r, c = r + row_incr, c + col_incr
+
         return False
 
+    def status(self, color):
+        '''
+            (in check, legal moves) of a color in this position, the moves packed in an array('H')
+            (see Move.encode and move.decode_moves). Computed once per position and color and cached
+            by the position hash, so the game end checks, the UI and the AI share one move generation
+        '''
+        key = (self.hash, color)
+        status = self.status_cache.get(key)
+        if status is None:
+            status = (self.is_in_check(color), self.legal_codes(color))
+            if len(self.status_cache) >= self.STATUS_CACHE_SIZE:
+                # oldest first
+                del self.status_cache[next(iter(self.status_cache))]
+            self.status_cache[key] = status
+        return status
+
     def has_legal_moves(self, color):
         """
-        Check if the given color has any legal moves.
+        Check if the given color has any legal moves. Answered from status() or the move map
+        when this position's moves are already known, otherwise stopping at the first legal move found.
         """
-        moves = []
-        for row in range(ROWS):
-            for col in range(COLS):
-                if self.squares[row][col].has_piece() and self.squares[row][col].piece.color == color:
-                    piece = self.squares[row][col].piece
-                    self.calc_moves(piece, row, col, bool=True)
-                    moves.extend(piece.moves)
-        return len(moves) > 0
+        status = self.status_cache.get((self.hash, color))
+        if status is not None:
+            return len(status[1]) > 0
+        if self.move_map is not None and self.move_map[0] == (self.hash, color):
+            return bool(self.move_map[1])
+        info = self._checks_and_pins(color)
+        # sorted copy, see legal_moves
+        for sq in sorted(self.piece_squares[color]):
+            row, col = divmod(sq, 8)
+            piece = self.squares[row][col].piece
+            # double check: only the king can move
+            if info and len(info[1]) > 1 and not isinstance(piece, King):
+                continue
+            self.calc_moves(piece, row, col, bool=False)
+            if any(not info or self._is_legal(piece, row, col, move, info) for move in piece.moves):
+                return True
+        return False
 
     def is_checkmate(self, color):
         """
@@ -149,12 +459,45 @@ class Board:
         """
         return not self.is_in_check(color) and not self.has_legal_moves(color)
 
+    def legal_moves(self, color):
+        '''
+            All the legal moves of a color. Checkers and pinned pieces are computed once
+            for the position and the pseudo legal moves are filtered with check and pin masks
+        '''
+        info = self._checks_and_pins(color)
+        moves = []
+        # only the color's own pieces, in board order; a sorted copy, as playing out an en passant
+        # capture changes the set while looping
+        for sq in sorted(self.piece_squares[color]):
+            row, col = divmod(sq, 8)
+            piece = self.squares[row][col].piece
+            # double check: only the king can move
+            if info and len(info[1]) > 1 and not isinstance(piece, King):
+                piece.clear_moves()
+                continue
+            self.calc_moves(piece, row, col, bool=False)
+            if info:
+                piece.moves = [move for move in piece.moves if self._is_legal(piece, row, col, move, info)]
+            moves.extend(piece.moves)
+        return moves
+
+    def legal_codes(self, color):
+        # legal moves packed one per 16-bit code
+        return encode_moves(self.legal_moves(color))
+
     def calc_moves(self, piece, row, col, bool=True):
         '''
             Calculate all the possible (valid) moves of an specific piece on a specific position
         '''
         piece.clear_moves()
         
+        def add_pawn_move(initial, final):
+            if final.row == 0 or final.row == 7:
+                for promotion in self.PROMOTIONS:
+                    piece.add_move(Move(initial, final, promotion))
+            else:
+                piece.add_move(Move(initial, final))
+
         def pawn_moves():
             # steps
             steps = 1 if piece.moved else 2
@@ -166,19 +509,10 @@ class Board:
                 if Square.in_range(possible_move_row):
                     if self.squares[possible_move_row][col].isempty():
                         # create initial and final move squares
-                        initial = Square(row, col)
-                        final = Square(possible_move_row, col)
-                        # create a new move
-                        move = Move(initial, final)
-
-                        # check potencial checks
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else:
-                            # append new move
-                            piece.add_move(move)
+                        initial = Square.at(row, col)
+                        final = Square.at(possible_move_row, col)
+                        # create a new move (one per promotion piece on the last rank)
+                        add_pawn_move(initial, final)
                     # blocked
                     else: break
                 # not in range
@@ -191,103 +525,47 @@ class Board:
                 if Square.in_range(possible_move_row, possible_move_col):
                     if self.squares[possible_move_row][possible_move_col].has_enemy_piece(piece.color):
                         # create initial and final move squares
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create a new move
-                        move = Move(initial, final)
-                        
-                        # check potencial checks
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else:
-                            # append new move
-                            piece.add_move(move)
+                        initial = Square.at(row, col)
+                        final = Square.at(possible_move_row, possible_move_col)
+                        # create a new move (one per promotion piece on the last rank)
+                        add_pawn_move(initial, final)
 
             # en passant moves
             r = 3 if piece.color == 'white' else 4
             fr = 2 if piece.color == 'white' else 5
-            # left en pessant
-            if Square.in_range(col-1) and row == r:
-                if self.squares[row][col-1].has_enemy_piece(piece.color):
-                    p = self.squares[row][col-1].piece
-                    if isinstance(p, Pawn):
-                        if p.en_passant:
-                            # create initial and final move squares
-                            initial = Square(row, col)
-                            final = Square(fr, col-1, p)
-                            # create a new move
-                            move = Move(initial, final)
-                            
-                            # check potencial checks
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
-            
-            # right en pessant
-            if Square.in_range(col+1) and row == r:
-                if self.squares[row][col+1].has_enemy_piece(piece.color):
-                    p = self.squares[row][col+1].piece
-                    if isinstance(p, Pawn):
-                        if p.en_passant:
-                            # create initial and final move squares
-                            initial = Square(row, col)
-                            final = Square(fr, col+1, p)
-                            # create a new move
-                            move = Move(initial, final)
-                            
-                            # check potencial checks
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
+            # left and right en pessant
+            for possible_move_col in possible_move_cols:
+                if Square.in_range(possible_move_col) and row == r:
+                    if self.squares[row][possible_move_col].has_enemy_piece(piece.color):
+                        p = self.squares[row][possible_move_col].piece
+                        if isinstance(p, Pawn):
+                            if p.en_passant:
+                                # create initial and final move squares
+                                initial = Square.at(row, col)
+                                final = Square.at(fr, possible_move_col)
+                                # create a new move
+                                move = Move(initial, final)
                                 # append new move
                                 piece.add_move(move)
 
-
         def knight_moves():
             # 8 possible moves
-            possible_moves = [
-                (row-2, col+1),
-                (row-1, col+2),
-                (row+1, col+2),
-                (row+2, col+1),
-                (row+2, col-1),
-                (row+1, col-2),
-                (row-1, col-2),
-                (row-2, col-1),
-            ]
-
-            for possible_move in possible_moves:
-                possible_move_row, possible_move_col = possible_move
+            for row_incr, col_incr in KNIGHT_JUMPS:
+                possible_move_row = row + row_incr
+                possible_move_col = col + col_incr
 
                 if Square.in_range(possible_move_row, possible_move_col):
                     if self.squares[possible_move_row][possible_move_col].isempty_or_enemy(piece.color):
                         # create squares of the new move
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
+                        initial = Square.at(row, col)
+                        final = Square.at(possible_move_row, possible_move_col)
                         # create new move
                         move = Move(initial, final)
-                        
-                        # check potencial checks
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                            else: break
-                        else:
-                            # append new move
-                            piece.add_move(move)
+                        # append new move
+                        piece.add_move(move)
 
         def straightline_moves(incrs):
+            initial = Square.at(row, col)
             for incr in incrs:
                 row_incr, col_incr = incr
                 possible_move_row = row + row_incr
@@ -295,38 +573,23 @@ class Board:
 
                 while True:
                     if Square.in_range(possible_move_row, possible_move_col):
-                        # create squares of the possible new move
-                        initial = Square(row, col)
+                        # squares of the possible new move
                         final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create a possible new move
-                        move = Move(initial, final)
+                        final = Square.at(possible_move_row, possible_move_col)
 
                         # empty = continue looping
-                        if self.squares[possible_move_row][possible_move_col].isempty():
-                            # check potencial checks
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
+                        if final_piece is None:
+                            # append new move
+                            piece.add_move(Move(initial, final))
 
                         # has enemy piece = add move + break
-                        elif self.squares[possible_move_row][possible_move_col].has_enemy_piece(piece.color):
-                            # check potencial checks
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
+                        elif final_piece.color != piece.color:
+                            # append new move
+                            piece.add_move(Move(initial, final))
                             break
 
                         # has team piece = break
-                        elif self.squares[possible_move_row][possible_move_col].has_team_piece(piece.color):
+                        else:
                             break
                     
                     # not in range
@@ -337,37 +600,20 @@ class Board:
                     possible_move_col = possible_move_col + col_incr
 
         def king_moves():
-            adjs = [
-                (row-1, col+0), # up
-                (row-1, col+1), # up-right
-                (row+0, col+1), # right
-                (row+1, col+1), # down-right
-                (row+1, col+0), # down
-                (row+1, col-1), # down-left
-                (row+0, col-1), # left
-                (row-1, col-1), # up-left
-            ]
-
             # normal moves
-            for possible_move in adjs:
-                possible_move_row, possible_move_col = possible_move
+            for row_incr, col_incr in KING_STEPS:
+                possible_move_row = row + row_incr
+                possible_move_col = col + col_incr
 
                 if Square.in_range(possible_move_row, possible_move_col):
                     if self.squares[possible_move_row][possible_move_col].isempty_or_enemy(piece.color):
                         # create squares of the new move
-                        initial = Square(row, col)
-                        final = Square(possible_move_row, possible_move_col) # piece=piece
+                        initial = Square.at(row, col)
+                        final = Square.at(possible_move_row, possible_move_col)
                         # create new move
                         move = Move(initial, final)
-                        # check potencial checks
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                            else: break
-                        else:
-                            # append new move
-                            piece.add_move(move)
+                        # append new move
+                        piece.add_move(move)
 
             # castling moves
             if not piece.moved:
@@ -384,28 +630,12 @@ class Board:
                                 # adds left rook to king
                                 piece.left_rook = left_rook
 
-                                # rook move
-                                initial = Square(row, 0)
-                                final = Square(row, 3)
-                                moveR = Move(initial, final)
-
-                                # king move
-                                initial = Square(row, col)
-                                final = Square(row, 2)
+                                # king move (the rook is moved along by make_move)
+                                initial = Square.at(row, col)
+                                final = Square.at(row, 2)
                                 moveK = Move(initial, final)
-
-                                # check potencial checks
-                                if bool:
-                                    if not self.in_check(piece, moveK) and not self.in_check(left_rook, moveR):
-                                        # append new move to rook
-                                        left_rook.add_move(moveR)
-                                        # append new move to king
-                                        piece.add_move(moveK)
-                                else:
-                                    # append new move to rook
-                                    left_rook.add_move(moveR)
-                                    # append new move king
-                                    piece.add_move(moveK)
+                                # append new move king
+                                piece.add_move(moveK)
 
                 # king castling
                 right_rook = self.squares[row][7].piece
@@ -420,28 +650,12 @@ class Board:
                                 # adds right rook to king
                                 piece.right_rook = right_rook
 
-                                # rook move
-                                initial = Square(row, 7)
-                                final = Square(row, 5)
-                                moveR = Move(initial, final)
-
-                                # king move
-                                initial = Square(row, col)
-                                final = Square(row, 6)
+                                # king move (the rook is moved along by make_move)
+                                initial = Square.at(row, col)
+                                final = Square.at(row, 6)
                                 moveK = Move(initial, final)
-
-                                # check potencial checks
-                                if bool:
-                                    if not self.in_check(piece, moveK) and not self.in_check(right_rook, moveR):
-                                        # append new move to rook
-                                        right_rook.add_move(moveR)
-                                        # append new move to king
-                                        piece.add_move(moveK)
-                                else:
-                                    # append new move to rook
-                                    right_rook.add_move(moveR)
-                                    # append new move king
-                                    piece.add_move(moveK)
+                                # append new move king
+                                piece.add_move(moveK)
 
         if isinstance(piece, Pawn): 
             pawn_moves()
@@ -450,36 +664,249 @@ class Board:
             knight_moves()
 
         elif isinstance(piece, Bishop): 
-            straightline_moves([
-                (-1, 1), # up-right
-                (-1, -1), # up-left
-                (1, 1), # down-right
-                (1, -1), # down-left
-            ])
+            straightline_moves(DIAGONALS)
 
         elif isinstance(piece, Rook): 
-            straightline_moves([
-                (-1, 0), # up
-                (0, 1), # right
-                (1, 0), # down
-                (0, -1), # left
-            ])
+            straightline_moves(STRAIGHTS)
 
         elif isinstance(piece, Queen): 
-            straightline_moves([
-                (-1, 1), # up-right
-                (-1, -1), # up-left
-                (1, 1), # down-right
-                (1, -1), # down-left
-                (-1, 0), # up
-                (0, 1), # right
-                (1, 0), # down
-                (0, -1) # left
-            ])
+            straightline_moves(DIAGONALS + STRAIGHTS)
 
         elif isinstance(piece, King): 
             king_moves()
 
+        # check potencial checks
+        if bool:
+            info = self._checks_and_pins(piece.color)
+            if info:
+                piece.moves = [move for move in piece.moves if self._is_legal(piece, row, col, move, info)]
+
+    def _king_square(self, color):
+        return self.king_squares.get(color)
+
+    def _index_pieces(self):
+        '''
+            Squares (row * 8 + col) of each color's pieces and (row, col) of each king,
+            scanned once here and then kept up to date by make_move and unmake_move
+        '''
+        self.piece_squares = {'white': set(), 'black': set()}
+        self.king_squares = {}
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                if piece:
+                    self.piece_squares[piece.color].add(row * 8 + col)
+                    if isinstance(piece, King):
+                        self.king_squares[piece.color] = (row, col)
+
+    def _attackers(self, row, col, by_color):
+        '''
+            Squares of the pieces of by_color attacking the square (row, col)
+        '''
+        attackers = []
+
+        # knights
+        for row_incr, col_incr in KNIGHT_JUMPS:
+            r, c = row + row_incr, col + col_incr
+            if Square.in_range(r, c):
+                p = self.squares[r][c].piece
+                if isinstance(p, Knight) and p.color == by_color:
+                    attackers.append((r, c))
+
+        # pawns (a pawn of by_color attacks forward diagonally)
+        r = row + (1 if by_color == 'white' else -1)
+        for c in (col - 1, col + 1):
+            if Square.in_range(r, c):
+                p = self.squares[r][c].piece
+                if isinstance(p, Pawn) and p.color == by_color:
+                    attackers.append((r, c))
+
+        # king
+        for row_incr, col_incr in KING_STEPS:
+            r, c = row + row_incr, col + col_incr
+            if Square.in_range(r, c):
+                p = self.squares[r][c].piece
+                if isinstance(p, King) and p.color == by_color:
+                    attackers.append((r, c))
+
+        # sliding pieces
+        for incrs, slider in ((STRAIGHTS, Rook), (DIAGONALS, Bishop)):
+            for row_incr, col_incr in incrs:
+                r, c = row + row_incr, col + col_incr
+                while Square.in_range(r, c):
+                    p = self.squares[r][c].piece
+                    if p:
+                        if p.color == by_color and isinstance(p, (slider, Queen)):
+                            attackers.append((r, c))
+                        break
+                    r, c = r + row_incr, c + col_incr
+
+        return attackers
+
+    def _checks_and_pins(self, color):
+        '''
+            Legality info of a color's position: (king square, checkers, check mask, pins).
+            The check mask holds the squares that capture or block a single checker,
+            pins maps a pinned piece's square to the squares it can still move to.
+        '''
+        king = self._king_square(color)
+        if not king:
+            return None
+        king_row, king_col = king
+        enemy_color = 'white' if color == 'black' else 'black'
+
+        checkers = self._attackers(king_row, king_col, enemy_color)
+        check_mask = set()
+        for r, c in checkers:
+            check_mask.add((r, c))
+            # squares in between a sliding checker and the king
+            if isinstance(self.squares[r][c].piece, (Bishop, Rook, Queen)):
+                row_incr = (r > king_row) - (r < king_row)
+                col_incr = (c > king_col) - (c < king_col)
+                r, c = king_row + row_incr, king_col + col_incr
+                while (r, c) not in check_mask:
+                    check_mask.add((r, c))
+                    r, c = r + row_incr, c + col_incr
+
+        pins = {}
+        for incrs, slider in ((STRAIGHTS, Rook), (DIAGONALS, Bishop)):
+            for row_incr, col_incr in incrs:
+                ray = []
+                pinned = None
+                r, c = king_row + row_incr, king_col + col_incr
+                while Square.in_range(r, c):
+                    ray.append((r, c))
+                    p = self.squares[r][c].piece
+                    if p:
+                        if p.color == color:
+                            if pinned:
+                                break
+                            pinned = (r, c)
+                        else:
+                            if pinned and isinstance(p, (slider, Queen)):
+                                pins[pinned] = set(ray)
+                            break
+                    r, c = r + row_incr, c + col_incr
+
+        return king, checkers, check_mask, pins
+
+    def _is_legal(self, piece, row, col, move, info):
+        '''
+            Whether a pseudo legal move of the piece on (row, col) leaves its king safe
+        '''
+        king, checkers, check_mask, pins = info
+        final = move.final
+        enemy_color = 'white' if piece.color == 'black' else 'black'
+
+        if isinstance(piece, King):
+            # castling: not out of, through or into check
+            if self.castling(move.initial, final):
+                if checkers:
+                    return False
+                col_incr = 1 if final.col > col else -1
+                return not self.is_square_attacked(row, col + col_incr, enemy_color) and \
+                       not self.is_square_attacked(row, final.col, enemy_color)
+
+            # the king can't step back along a checking ray either, so lift it while probing
+            self.squares[row][col].piece = None
+            attacked = self.is_square_attacked(final.row, final.col, enemy_color)
+            self.squares[row][col].piece = piece
+            return not attacked
+
+        # en passant removes two pieces from the capture rank, just play it out
+        if isinstance(piece, Pawn) and final.col != col and self.squares[final.row][final.col].isempty():
+            return not self.in_check(piece, move)
+
+        if checkers and (final.row, final.col) not in check_mask:
+            return False
+
+        if (row, col) in pins and (final.row, final.col) not in pins[(row, col)]:
+            return False
+
+        return True
+
+    def _castling_rights(self):
+        '''
+            4-bit castling rights mask: white kingside, white queenside, black kingside, black queenside
+        '''
+        rights = 0
+        for bit, (row, rook_col) in enumerate([(7, 7), (7, 0), (0, 7), (0, 0)]):
+            color = 'white' if row == 7 else 'black'
+            king = self.squares[row][4].piece
+            rook = self.squares[row][rook_col].piece
+            # a rook promoted on the opponent's corner is unmoved too, but gives no right
+            if isinstance(king, King) and not king.moved and king.color == color and \
+                    isinstance(rook, Rook) and not rook.moved and rook.color == color:
+                rights |= 1 << bit
+        return rights
+
+    def _compute_hash(self):
+        '''
+            Zobrist hash of the position from scratch (make_move keeps it up to date incrementally)
+        '''
+        h = 0
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                if piece:
+                    h ^= PIECE_KEYS[piece.color][piece.name][row * 8 + col]
+        h ^= castling_key(self.castling_rights)
+        if self.en_passant_pawn:
+            h ^= EN_PASSANT_KEYS[self.en_passant_col]
+        if self.next_player == 'black':
+            h ^= SIDE_KEY
+        return h
+
+    def _load_fen(self, fen):
+        fields = fen.split()
+        placement = fields[0]
+        side = fields[1] if len(fields) > 1 else 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        en_passant = fields[3] if len(fields) > 3 else '-'
+        self.fullmove = int(fields[5]) if len(fields) > 5 else 1
+
+        for row, fen_row in enumerate(placement.split('/')):
+            col = 0
+            for char in fen_row:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                color = 'white' if char.isupper() else 'black'
+                piece = self.FEN_PIECES[char.lower()](color)
+                self.squares[row][col].piece = piece
+                col += 1
+
+        # moved flags carry the castling rights and the pawn double steps
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                if isinstance(piece, Pawn):
+                    piece.moved = row != (6 if piece.color == 'white' else 1)
+                elif isinstance(piece, (King, Rook)):
+                    piece.moved = True
+        for flag, row, rook_col in [('K', 7, 7), ('Q', 7, 0), ('k', 0, 7), ('q', 0, 0)]:
+            if flag in castling:
+                self.squares[row][4].piece.moved = False
+                self.squares[row][rook_col].piece.moved = False
+
+        if en_passant != '-':
+            col = Square.get_col(en_passant[0])
+            row = 3 if side == 'w' else 4
+            self.en_passant_pawn = self.squares[row][col].piece
+            self.en_passant_pawn.en_passant = True
+            self.en_passant_col = col
+
+        self.next_player = 'white' if side == 'w' else 'black'
+
+    def _compute_score(self):
+        '''
+            Material and position score from white's point of view (make_move keeps it up to date incrementally)
+        '''
+        score = 0
+        for row, col, name, color in self.pieces():
+            score += PIECE_SQUARE_VALUES[color][name][row * 8 + col]
+        return score
+
     def _create(self):
         for row in range(ROWS):
             for col in range(COLS):
@@ -0,0 +1,252 @@
+'''
+    Opening book in the Polyglot .bin layout.
+
+    The file is a sorted array of 16-byte big-endian entries (key u64, move u16, weight u16, learn u32),
+    looked up with a binary search over a read-only mmap. Moves use the Polyglot encoding (to square in
+    bits 0-5, from square in bits 6-11, promotion piece in bits 12-14, castling as king takes own rook).
+    The keys are standard Polyglot keys (polyglot.py), so books made by other Polyglot tools can be used too.
+
+    Build a book from the src folder:
+        python -m book build games.pgn more_games.pgn -o ../assets/book.bin --max-ply 24
+        python -m book probe "<fen>"
+'''
+import argparse
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+from collections import defaultdict
+
+from const import *
+from move import Move, PROMOTION_CODES, PROMOTION_NAMES
+from polyglot import polyglot_key
+from square import Square
+
+ENTRY = struct.Struct('>QHHI')
+
+class OpeningBook:
+
+    def __init__(self, path):
+        self.path = path
+        self.mm = None
+        self.size = os.path.getsize(path) // ENTRY.size
+        if self.size:
+            with open(path, 'rb') as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _key(self, index):
+        return struct.unpack_from('>Q', self.mm, index * ENTRY.size)[0]
+
+    def entries(self, key):
+        '''
+            (polyglot move, weight) of every entry for key
+        '''
+        # lower bound binary search
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        result = []
+        for index in range(low, self.size):
+            entry_key, move, weight, _ = ENTRY.unpack_from(self.mm, index * ENTRY.size)
+            if entry_key != key:
+                break
+            result.append((move, weight))
+        return result
+
+    def moves(self, board, color):
+        '''
+            (Move, weight) of the legal book moves in the board's position
+        '''
+        entries = self.entries(polyglot_key(board))
+        if not entries:
+            return []
+        legal = {move.encode(): move for move in board.legal_moves(color)}
+        result = []
+        for code, weight in entries:
+            move = legal.get(decode_move(code, board))
+            if move and weight:
+                result.append((move, weight))
+        return result
+
+    def choose(self, board, color, rng=random):
+        '''
+            A book move picked at random in proportion to its weight, or None when out of book
+        '''
+        moves = self.moves(board, color)
+        if not moves:
+            return None
+        pick = rng.uniform(0, sum(weight for _, weight in moves))
+        for move, weight in moves:
+            pick -= weight
+            if pick <= 0:
+                return move
+        return moves[-1][0]
+
+    def close(self):
+        if self.mm:
+            self.mm.close()
+            self.mm = None
+
+def _polyglot_square(row, col):
+    # polyglot squares count from a1, the board's rows from rank 8
+    return (7 - row) * 8 + col
+
+def encode_move(move, board):
+    '''
+        Polyglot code of a legal move, before it is played on board
+    '''
+    initial, final = move.initial, move.final
+    final_col = final.col
+    # castling is written as the king capturing its own rook
+    if board.piece_name(initial.row, initial.col) == 'king' and abs(final.col - initial.col) == 2:
+        final_col = 7 if final.col > initial.col else 0
+    return PROMOTION_CODES[move.promotion] << 12 | _polyglot_square(initial.row, initial.col) << 6 | \
+           _polyglot_square(final.row, final_col)
+
+def decode_move(code, board):
+    '''
+        Move code (see Move.encode) of a polyglot move in the board's position
+    '''
+    from_row, from_col = 7 - (code >> 9 & 7), code >> 6 & 7
+    to_row, to_col = 7 - (code >> 3 & 7), code & 7
+    if board.piece_name(from_row, from_col) == 'king' and from_col == 4 and to_col in (0, 7) and from_row == to_row:
+        to_col = 6 if to_col == 7 else 2
+    return Move(Square.at(from_row, from_col), Square.at(to_row, to_col), PROMOTION_NAMES[code >> 12 & 7]).encode()
+
+# Book used by the AI, opened on first use
+_book = None
+
+def book_move(board, color, path=AI_BOOK):
+    '''
+        Move from the AI's opening book for this position, or None when there is no book or no entry
+    '''
+    global _book
+    if _book is None:
+        _book = OpeningBook(path) if os.path.exists(path) else False
+    if not _book:
+        return None
+    return _book.choose(board, color)
+
+# PGN reading
+
+SAN_PIECES = {'N': 'knight', 'B': 'bishop', 'R': 'rook', 'Q': 'queen', 'K': 'king'}
+RESULTS = {'1-0': 'white', '0-1': 'black', '1/2-1/2': None, '*': None}
+
+def read_pgn(path):
+    '''
+        Yield (san moves, result) for every game of a PGN file
+    '''
+    with open(path, encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    for game in re.split(r'\n\s*\n(?=\[)', text):
+        result = re.search(r'\[Result "([^"]*)"\]', game)
+        movetext = re.sub(r'^\[.*\]\s*$', '', game, flags=re.M)
+        # comments, variations, annotations and move numbers
+        movetext = re.sub(r'\{[^}]*\}|;[^\n]*', ' ', movetext)
+        while re.search(r'\([^()]*\)', movetext):
+            movetext = re.sub(r'\([^()]*\)', ' ', movetext)
+        movetext = re.sub(r'\$\d+|\d+\.(\.\.)?', ' ', movetext)
+        tokens = [t for t in movetext.split() if t not in RESULTS]
+        if tokens:
+            yield tokens, result.group(1) if result else '*'
+
+def parse_san(board, color, san):
+    '''
+        Legal move of color matching a SAN string such as Nbd7, exf6, O-O or e8=Q
+    '''
+    san = san.rstrip('+#!?')
+    moves = board.legal_moves(color)
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        col = 6 if san in ('O-O', '0-0') else 2
+        return next((m for m in moves if board.piece_name(m.initial.row, m.initial.col) == 'king'
+                     and m.initial.col == 4 and m.final.col == col), None)
+
+    promotion = None
+    match = re.search(r'=?([QRBN])$', san)
+    if match and re.search(r'[18]=?[QRBN]$', san):
+        promotion = SAN_PIECES[match.group(1)]
+        san = san[:match.start()]
+    piece = SAN_PIECES.get(san[0], 'pawn')
+    if piece != 'pawn':
+        san = san[1:]
+    final = Square.at(8 - int(san[-1]), Square.get_col(san[-2]))
+    hint = san[:-2].replace('x', '')
+
+    for move in moves:
+        if move.final != final or move.promotion != promotion:
+            continue
+        if board.piece_name(move.initial.row, move.initial.col) != piece:
+            continue
+        # disambiguation: file and/or rank of the moving piece
+        if any((c.isalpha() and Square.get_col(c) != move.initial.col) or
+               (c.isdigit() and 8 - int(c) != move.initial.row) for c in hint):
+            continue
+        return move
+    return None
+
+def build_book(pgn_paths, out_path, max_ply=24):
+    '''
+        Write a book with the first max_ply moves of every game. Weights are 2 per win and 1 per draw
+        for the side that played the move; moves that only lost are left out
+    '''
+    from bitboard import BitBoard
+
+    weights = defaultdict(int)
+    games = skipped = 0
+    for path in pgn_paths:
+        for sans, result in read_pgn(path):
+            board = BitBoard()
+            for san in sans[:max_ply]:
+                color = board.next_player
+                move = parse_san(board, color, san)
+                if move is None:
+                    skipped += 1
+                    break
+                winner = RESULTS.get(result)
+                points = 2 if winner == color else 1 if winner is None else 0
+                weights[(polyglot_key(board), encode_move(move, board))] += points
+                board.make_move(move)
+            games += 1
+
+    # polyglot weights are 16 bits
+    scale = max(1, max(weights.values(), default=0) / 0xFFFF)
+    entries = sorted((key, code, max(1, int(weight / scale)))
+                     for (key, code), weight in weights.items() if weight)
+    with open(out_path, 'wb') as f:
+        for key, code, weight in entries:
+            f.write(ENTRY.pack(key, code, weight, 0))
+    return games, skipped, len(entries)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='book', description='Build and probe opening books')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build a book from PGN files')
+    build.add_argument('pgn', nargs='+')
+    build.add_argument('-o', '--output', default=AI_BOOK)
+    build.add_argument('--max-ply', type=int, default=24)
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('fen', nargs='?')
+    probe.add_argument('--book', default=AI_BOOK)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        games, skipped, entries = build_book(args.pgn, args.output, args.max_ply)
+        print(f'{games} games, {entries} entries written to {args.output}' +
+              (f' ({skipped} games cut short by an unreadable move)' if skipped else ''))
+    else:
+        from bitboard import BitBoard
+        board = BitBoard(args.fen)
+        book = OpeningBook(args.book)
+        for move, weight in sorted(book.moves(board, board.next_player), key=lambda m: -m[1]):
+            print(f'{move.uci()} {weight}')
+        book.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
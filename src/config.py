@@ -1,7 +1,9 @@
 import pygame
 import os
 
+from const import *
 from sound import Sound
+from square import Square
 from theme import Theme
 
 class Config:
@@ -13,6 +15,10 @@ class Config:
         self.idx = 0
         self.theme = self.themes[self.idx]
         self.font = pygame.font.SysFont('monospace', 18, bold=True)
+        # (theme index, surface size) -> board background with its coordinate labels
+        self.backgrounds = {}
+        # (text, color) -> rendered label
+        self.labels = {}
         
         # Use absolute paths based on this file's location
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -26,6 +32,60 @@ class Config:
         self.idx %= len(self.themes)
         self.theme = self.themes[self.idx]
 
+    def background(self, size):
+        '''
+            Board background of the current theme for a surface of the given size, rendered once per theme and size
+        '''
+        key = (self.idx, size)
+        if key not in self.backgrounds:
+            self.backgrounds[key] = self._render_background(size)
+        return self.backgrounds[key]
+
+    def label(self, text, color):
+        key = (text, color)
+        if key not in self.labels:
+            self.labels[key] = self.font.render(text, 1, color)
+        return self.labels[key]
+
+    def _render_background(self, size):
+        width, height = size
+        sqsize = width // COLS
+        theme = self.theme
+        surface = pygame.Surface(size)
+        if pygame.display.get_surface():
+            surface = surface.convert()
+
+        for row in range(ROWS):
+            for col in range(COLS):
+                # color
+                color = theme.bg.light if (row + col) % 2 == 0 else theme.bg.dark
+                # rect
+                rect = (col * sqsize, row * sqsize, sqsize, sqsize)
+                # blit
+                pygame.draw.rect(surface, color, rect)
+
+                # row coordinates
+                if col == 0:
+                    # color
+                    color = theme.bg.dark if row % 2 == 0 else theme.bg.light
+                    # label
+                    lbl = self.label(str(ROWS-row), color)
+                    lbl_pos = (5, 5 + row * sqsize)
+                    # blit
+                    surface.blit(lbl, lbl_pos)
+
+                # col coordinates
+                if row == ROWS - 1:
+                    # color
+                    color = theme.bg.dark if (row + col) % 2 == 0 else theme.bg.light
+                    # label
+                    lbl = self.label(Square.get_alphacol(col), color)
+                    lbl_pos = (col * sqsize + sqsize - 20, height - 20)
+                    # blit
+                    surface.blit(lbl, lbl_pos)
+
+        return surface
+
     def _add_themes(self):
         green = Theme((234, 235, 200), (119, 154, 88), (244, 247, 116), (172, 195, 51), '#C86464', '#C84646')
         brown = Theme((235, 209, 166), (165, 117, 80), (245, 234, 100), (209, 185, 59), '#C86464', '#C84646')
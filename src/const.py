@@ -1,3 +1,5 @@
+import os
+
 # Screen dimensions
 WIDTH = 800
 HEIGHT = 800
@@ -5,4 +7,32 @@ HEIGHT = 800
 # Board dimensions
 ROWS = 8
 COLS = 8
-SQSIZE = WIDTH // COLS
\ No newline at end of file
+SQSIZE = WIDTH // COLS
+
+# Rendering
+FPS = 60
+
+# AI settings
+TT_SIZE_MB = 32
+AI_TIME_MS = 1500
+AI_MAX_DEPTH = 8
+# keep searching the expected reply while the human thinks
+AI_PONDER = True
+# processes searching root moves in parallel (1 = search in the engine process itself)
+AI_WORKERS = 1
+# how the workers share a search: 'root' splits the root moves, 'lazy-smp' shares a transposition table
+AI_PARALLEL = 'root'
+# position backend of the engine's searches: 'bitboard' (faster) or 'board', the GUI's own representation
+AI_BACKEND = 'bitboard'
+# opening book (see book.py), played instantly while the position is in it
+AI_USE_BOOK = True
+AI_BOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'book.bin')
+# endgame tablebases (see tablebase.py), used by the search and the evaluation when the files exist
+AI_USE_TABLEBASES = True
+AI_TABLEBASES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'tablebases')
+
+# Move directions (row increment, col increment)
+STRAIGHTS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+DIAGONALS = [(-1, 1), (-1, -1), (1, 1), (1, -1)]
+KING_STEPS = STRAIGHTS + DIAGONALS
+KNIGHT_JUMPS = [(-2, 1), (-1, 2), (1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1)]
@@ -1,6 +1,7 @@
 import pygame
 
 from const import *
+from assets import assets
 
 class Dragger:
 
@@ -16,22 +17,26 @@ class Dragger:
 
     def update_blit(self, surface):
         # texture
-        self.piece.set_texture(size=128)
-        texture = self.piece.texture
-        # img
-        try:
-            img = pygame.image.load(texture)
+        img = assets.piece_texture(self.piece.color, self.piece.name, size=128)
+        if img is not None:
             # rect
             img_center = (self.mouseX, self.mouseY)
             self.piece.texture_rect = img.get_rect(center=img_center)
             # blit
             surface.blit(img, self.piece.texture_rect)
-        except pygame.error:
-            print(f"Warning: Could not load dragged piece image {texture}")
+        else:
             # Draw a placeholder circle for dragged piece
             color = (255, 0, 0) if self.piece.color == 'red' else (0, 0, 255)  # fallback colors
             pygame.draw.circle(surface, color, (self.mouseX, self.mouseY), 30)
 
+    def rect(self):
+        '''
+            Screen area covered by the dragged piece at the current mouse position
+        '''
+        rect = pygame.Rect(0, 0, 128, 128)
+        rect.center = (self.mouseX, self.mouseY)
+        return rect
+
     # other methods
 
     def update_mouse(self, pos):
@@ -0,0 +1,223 @@
+import atexit
+import multiprocessing
+import time
+import traceback
+
+from const import *
+
+class _Cancelled:
+    '''
+        Stop token of one search: set once the UI has cancelled this search id or a later one,
+        or once the wall-clock deadline the UI set for it (see Engine.ponder_hit) has passed
+    '''
+
+    def __init__(self, cancelled_id, deadline, search_id):
+        self.cancelled_id = cancelled_id
+        self.deadline = deadline
+        self.search_id = search_id
+
+    def is_set(self):
+        return self.cancelled_id.value >= self.search_id or time.time() > self.deadline.value
+
+def _worker(conn, cancelled_id, deadline):
+    '''
+        Engine process: waits for positions on the pipe and answers with search progress and the best move.
+
+        Requests:  ('search', search_id, fen, color, time_ms, max_depth) | ('quit',)
+        Replies:   ('info', search_id, depth, score, pv) | ('bestmove', search_id, move, stats)
+        Moves are sent in uci notation. A search that raises still gets its bestmove reply, with no move.
+    '''
+    # imported here so the UI process doesn't pay for the engine modules twice
+    import ai
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            # the UI process is gone
+            break
+        if request[0] == 'quit':
+            break
+
+        _, search_id, fen, color, time_ms, max_depth = request
+
+        def on_iteration(depth, score, pv):
+            conn.send(('info', search_id, depth, score, [move.uci() for move in pv]))
+
+        try:
+            board = ai.search_board(fen)
+            move = ai.get_best_move(board, color, time_ms=time_ms, max_depth=max_depth, on_iteration=on_iteration,
+                                    stop=_Cancelled(cancelled_id, deadline, search_id))
+        except Exception:
+            # a failed search must not take the engine down, the UI is waiting for its reply
+            traceback.print_exc()
+            move = None
+        conn.send(('bestmove', search_id, move.uci() if move else None, ai.transposition_table.stats()))
+
+    from parallel import root_pool, smp_pool
+    root_pool.shutdown()
+    smp_pool.shutdown()
+
+class Engine:
+    '''
+        Runs the search in a separate process so the UI keeps drawing and handling input while the AI thinks
+    '''
+
+    def __init__(self):
+        self.process = None
+        self.conn = None
+        # highest cancelled search id, shared with the worker so it can stop mid-search
+        self.cancelled_id = None
+        # time.time() at which the current search stops, set on a ponder hit
+        self.deadline = None
+        self.search_id = 0
+        self.thinking = False
+        # pondering: searching the position after the expected reply, on the opponent's time
+        self.pondering = False
+        self.ponder_result = None
+        self.ponder_pv = []
+
+    def start(self):
+        if self.process and self.process.is_alive():
+            return
+        # spawn instead of fork: the UI process holds the pygame display and mixer
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.cancelled_id = context.Value('i', self.search_id, lock=False)
+        self.deadline = context.Value('d', float('inf'), lock=False)
+        # not a daemon, so it may start the parallel search pool; stopped by quit, at the latest at exit
+        self.process = context.Process(target=_worker, args=(child_conn, self.cancelled_id, self.deadline))
+        self.process.start()
+        atexit.unregister(self.quit)
+        atexit.register(self.quit)
+
+    def search(self, fen, color, time_ms=AI_TIME_MS, max_depth=AI_MAX_DEPTH):
+        '''
+            Start searching a position, the result is picked up with poll()
+        '''
+        self.start()
+        self.search_id += 1
+        self.thinking = True
+        self.deadline.value = float('inf')
+        self.conn.send(('search', self.search_id, fen, color, time_ms, max_depth))
+
+    def poll(self):
+        '''
+            Next message of the current search without blocking, or None.
+            Messages of an abandoned search are dropped.
+            If the worker has died, a new one is started and the current search ends with no move
+        '''
+        while self.conn:
+            try:
+                if not self.conn.poll():
+                    break
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                return self._restart()
+            if message[1] != self.search_id:
+                continue
+            if self.pondering:
+                # kept back until the opponent has moved, see stop_ponder
+                if message[0] == 'bestmove':
+                    self.ponder_result = message
+                else:
+                    self.ponder_pv = message[4]
+                continue
+            if message[0] == 'bestmove':
+                self.thinking = False
+            return message
+        if (self.thinking or self.pondering) and not self.process.is_alive():
+            return self._restart()
+        return None
+
+    def _restart(self):
+        '''
+            Replace a dead worker. Returns a bestmove message with no move for the search it was running,
+            so the game falls back as if no move was found; a ponder search is just dropped
+        '''
+        thinking = self.thinking
+        self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+        self.thinking = False
+        self.pondering = False
+        self.ponder_result = None
+        self.start()
+        return ('bestmove', self.search_id, None, {}) if thinking else None
+
+    def ponder(self, fen, color, max_depth=AI_MAX_DEPTH):
+        '''
+            Search the position after the expected reply with no time limit, while the opponent thinks.
+            If the opponent plays that reply, ponder_hit turns it into the search for the engine's move;
+            otherwise stop_ponder drops it, leaving what it found in the engine's transposition table
+        '''
+        self.search(fen, color, time_ms=float('inf'), max_depth=max_depth)
+        self.thinking = False
+        self.pondering = True
+        self.ponder_result = None
+        self.ponder_pv = []
+
+    def ponder_hit(self, time_ms=AI_TIME_MS):
+        '''
+            The opponent played the expected reply: the ponder search goes on as the search for the engine's move,
+            and stops time_ms from now with the move of its last completed iteration. Returns its bestmove message
+            if it has already finished, else None and the result comes from poll() as after search().
+            Not thinking afterwards means the worker had died and a new search has to be started
+        '''
+        self.poll()
+        if not self.pondering:
+            return None
+        self.pondering = False
+        result = self.ponder_result
+        self.ponder_result = None
+        if result is None:
+            self.deadline.value = time.time() + time_ms / 1000
+            self.thinking = True
+        return result
+
+    def stop_ponder(self):
+        '''
+            End pondering. Returns the finished ponder search's bestmove message, or None
+            if it was still running, in which case it is cancelled
+        '''
+        if not self.pondering:
+            return None
+        self.poll()
+        result = self.ponder_result
+        if result is None:
+            self.cancel()
+        self.pondering = False
+        self.ponder_result = None
+        return result
+
+    def cancel(self):
+        '''
+            Stop the current search; the worker unwinds within a few hundred nodes and its result is ignored
+        '''
+        if self.cancelled_id is not None:
+            self.cancelled_id.value = self.search_id
+        self.search_id += 1
+        self.thinking = False
+        self.pondering = False
+        self.ponder_result = None
+
+    def quit(self):
+        self.cancel()
+        if self.process and self.process.is_alive():
+            try:
+                self.conn.send(('quit',))
+            except (BrokenPipeError, EOFError, OSError):
+                # the worker is exiting already, terminate below if it hangs
+                pass
+            self.process.join(timeout=1)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.process = None
+        self.conn = None
+        self.cancelled_id = None
+        self.deadline = None
+        self.thinking = False
+
+# Shared by every Game, so the process survives Game.reset
+engine = Engine()
@@ -1,11 +1,13 @@
 import pygame
+import random
 
 from const import *
 from board import Board
 from dragger import Dragger
 from config import Config
-from square import Square
-from ai import get_best_move
+from assets import assets
+from move import Move
+from engine import engine
 
 class Game:
 
@@ -18,40 +20,61 @@ class Game:
         self.ai_mode = False  # Add AI mode flag
         self.game_over = False
         self.winner = None  # 'white', 'black', or 'draw'
+        # principal variation of the AI's last search, and the reply it is pondering on
+        self.ai_pv = []
+        self.ponder_move = None
+        # screen areas to redraw on the next frame
+        self.dirty_rects = []
+        self.full_redraw = True
+        # the first turn's moves, ready before the first click
+        self.board.legal_move_map(self.next_player)
+
+    # render methods
+
+    def mark_dirty(self, rect=None):
+        '''
+            Queue a screen area for redrawing, or the whole window if no rect is given
+        '''
+        if rect is None:
+            self.full_redraw = True
+        else:
+            self.dirty_rects.append(pygame.Rect(rect))
+
+    def mark_square_dirty(self, row, col):
+        self.mark_dirty((col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE))
+
+    def needs_redraw(self):
+        return self.full_redraw or bool(self.dirty_rects)
+
+    def render(self, surface):
+        '''
+            Redraw only the dirty areas, clipping the usual show methods to each of them.
+            Returns the rects that changed, for pygame.display.update
+        '''
+        if self.full_redraw:
+            rects = [surface.get_rect()]
+        else:
+            rects = self.dirty_rects
+
+        for rect in rects:
+            surface.set_clip(rect)
+            self.show_bg(surface)
+            self.show_last_move(surface)
+            self.show_moves(surface)
+            self.show_pieces(surface)
+            self.show_hover(surface)
+            if self.dragger.dragging:
+                self.dragger.update_blit(surface)
+        surface.set_clip(None)
+
+        self.dirty_rects = []
+        self.full_redraw = False
+        return rects
 
     # blit methods
 
     def show_bg(self, surface):
-        theme = self.config.theme
-        
-        for row in range(ROWS):
-            for col in range(COLS):
-                # color
-                color = theme.bg.light if (row + col) % 2 == 0 else theme.bg.dark
-                # rect
-                rect = (col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
-                # blit
-                pygame.draw.rect(surface, color, rect)
-
-                # row coordinates
-                if col == 0:
-                    # color
-                    color = theme.bg.dark if row % 2 == 0 else theme.bg.light
-                    # label
-                    lbl = self.config.font.render(str(ROWS-row), 1, color)
-                    lbl_pos = (5, 5 + row * SQSIZE)
-                    # blit
-                    surface.blit(lbl, lbl_pos)
-
-                # col coordinates
-                if row == 7:
-                    # color
-                    color = theme.bg.dark if (row + col) % 2 == 0 else theme.bg.light
-                    # label
-                    lbl = self.config.font.render(Square.get_alphacol(col), 1, color)
-                    lbl_pos = (col * SQSIZE + SQSIZE - 20, HEIGHT - 20)
-                    # blit
-                    surface.blit(lbl, lbl_pos)
+        surface.blit(self.config.background(surface.get_size()), (0, 0))
 
     def show_pieces(self, surface):
         for row in range(ROWS):
@@ -62,14 +85,12 @@ class Game:
                     
                     # all pieces except dragger piece
                     if piece is not self.dragger.piece:
-                        piece.set_texture(size=80)
-                        try:
-                            img = pygame.image.load(piece.texture)
+                        img = assets.piece_texture(piece.color, piece.name, size=80)
+                        if img is not None:
                             img_center = col * SQSIZE + SQSIZE // 2, row * SQSIZE + SQSIZE // 2
                             piece.texture_rect = img.get_rect(center=img_center)
                             surface.blit(img, piece.texture_rect)
-                        except pygame.error:
-                            print(f"Warning: Could not load piece image {piece.texture}")
+                        else:
                             # Draw a placeholder rectangle instead
                             color = (255, 0, 0) if piece.color == 'red' else (0, 0, 255)  # fallback colors
                             rect = (col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
@@ -79,10 +100,8 @@ class Game:
         theme = self.config.theme
 
         if self.dragger.dragging:
-            piece = self.dragger.piece
-
             # loop all valid moves
-            for move in piece.moves:
+            for move in self.board.moves_from(self.dragger.initial_row, self.dragger.initial_col):
                 # color
                 color = theme.moves.light if (move.final.row + move.final.col) % 2 == 0 else theme.moves.dark
                 # rect
@@ -118,27 +137,39 @@ class Game:
 
     def next_turn(self):
         self.next_player = 'white' if self.next_player == 'black' else 'black'
+        self.mark_dirty()
         
-        # Check for game end conditions
+        # Check for game end conditions, with one move generation the click handler reuses
         opponent = 'white' if self.next_player == 'black' else 'black'
-        if self.board.is_checkmate(self.next_player):
-            self.game_over = True
+        in_check, moves = self.board.status(self.next_player)
+        if moves:
+            # index the moves by square now, while the move sound plays, so picking up a piece is instant
+            self.board.legal_move_map(self.next_player)
+            return
+        self.game_over = True
+        if in_check:
             self.winner = opponent  # The player who just moved won
             print(f"Checkmate! {opponent.capitalize()} wins!")
-        elif self.board.is_stalemate(self.next_player):
-            self.game_over = True
+        else:
             self.winner = 'draw'
             print("Stalemate! It's a draw!")
 
     def set_hover(self, row, col):
         # Check if row and col are within valid range
         if 0 <= row < 8 and 0 <= col < 8:
-            self.hovered_sqr = self.board.squares[row][col]
+            hovered_sqr = self.board.squares[row][col]
         else:
-            self.hovered_sqr = None
+            hovered_sqr = None
+
+        if hovered_sqr is not self.hovered_sqr:
+            for sqr in (self.hovered_sqr, hovered_sqr):
+                if sqr:
+                    self.mark_square_dirty(sqr.row, sqr.col)
+            self.hovered_sqr = hovered_sqr
 
     def change_theme(self):
         self.config.change_theme()
+        self.mark_dirty()
 
     def play_sound(self, captured=False):
         if captured:
@@ -147,33 +178,43 @@ class Game:
             self.config.move_sound.play()
 
     def reset(self):
+        # a search of the old game must not play into the new one
+        engine.cancel()
         self.__init__()
 
     def toggle_ai_mode(self):
         self.ai_mode = not self.ai_mode
+        # the side the AI was thinking for is back in human hands
+        engine.cancel()
         print(f"AI mode: {self.ai_mode}")
 
     def make_ai_move(self):
         if self.ai_mode and self.next_player == 'black' and not self.game_over:  # Assuming AI plays black
-            print("AI is thinking...")
-            best_move = get_best_move(self.board, self.next_player, depth=2)
-            print(f"Best move: {best_move}")
-            if best_move:
-                piece = self.board.squares[best_move.initial.row][best_move.initial.col].piece
-                # Validate the move before executing (same as human players)
-                if self.board.valid_move(piece, best_move):
-                    captured = self.board.squares[best_move.final.row][best_move.final.col].has_piece()
-                    self.board.move(piece, best_move)
-                    self.board.set_true_en_passant(piece)
-                    self.play_sound(captured)
-                    self.next_turn()
+            if engine.thinking:
+                return
+            if engine.pondering:
+                predicted = self.board.last_move and self.board.last_move.uci() == self.ponder_move
+                if predicted:
+                    # the expected reply was played: the ponder search carries on with the normal time budget
+                    result = engine.ponder_hit(AI_TIME_MS)
+                    self.ai_pv = engine.ponder_pv
+                    if result:
+                        print("Ponder hit")
+                        _, _, uci, stats = result
+                        self.play_ai_move(uci, stats)
+                        return
+                    if engine.thinking:
+                        # update_ai picks up the result
+                        print("Ponder hit, searching on")
+                        return
                 else:
-                    print(f"AI tried to make invalid move: {best_move}")
-                    # Skip turn or handle error
-            else:
-                # No moves available - this should trigger checkmate/stalemate detection
-                print("AI has no legal moves")
-                self.next_turn()  # This will check for game end conditions
+                    # the search below still finds the pondered positions in the transposition table
+                    engine.stop_ponder()
+                    print("Ponder miss")
+            print("AI is thinking...")
+            # the search runs in the engine process, update_ai picks up the result
+            self.ai_pv = []
+            engine.search(self.board.to_fen(), self.next_player, time_ms=AI_TIME_MS, max_depth=AI_MAX_DEPTH)
         else:
             # Debug why AI isn't moving
             if not self.ai_mode:
@@ -182,3 +223,72 @@ class Game:
                 print(f"DEBUG: AI not moving - next_player is {self.next_player}, not black")
             elif self.game_over:
                 print(f"DEBUG: AI not moving - game is over")
+
+    def update_ai(self):
+        '''
+            Check the engine for a finished search without blocking, and play its move
+        '''
+        message = engine.poll()
+        while message and message[0] == 'info':
+            _, _, depth, score, pv = message
+            print(f"AI depth {depth}: score {score}, pv {' '.join(pv)}")
+            self.ai_pv = pv
+            message = engine.poll()
+        if not message:
+            return
+
+        _, _, uci, stats = message
+        if not self.ai_mode or self.next_player != 'black' or self.game_over:
+            return
+        self.play_ai_move(uci, stats)
+
+    def play_ai_move(self, uci, stats):
+        best_move = Move.from_uci(uci) if uci else None
+        if best_move is None:
+            _, moves = self.board.status(self.next_player)
+            if moves:
+                # the search failed in the engine process, play a legal move rather than pass the turn
+                print("AI search failed, playing a random legal move")
+                best_move = Move.decode(random.choice(moves))
+                uci = best_move.uci()
+        print(f"Best move: {best_move}")
+        print(f"Transposition table: {stats}")
+        if best_move:
+            piece = self.board.squares[best_move.initial.row][best_move.initial.col].piece
+            # Validate the move before executing (same as human players)
+            if piece and self.board.valid_move(piece, best_move):
+                captured = self.board.squares[best_move.final.row][best_move.final.col].has_piece()
+                self.board.move(piece, best_move)
+                self.play_sound(captured)
+                self.next_turn()
+                if AI_PONDER and not self.game_over:
+                    self.start_ponder(uci)
+            else:
+                print(f"AI tried to make invalid move: {best_move}")
+                # Skip turn or handle error
+        else:
+            # No moves available - this should trigger checkmate/stalemate detection
+            print("AI has no legal moves")
+            self.next_turn()  # This will check for game end conditions
+
+    def start_ponder(self, played):
+        '''
+            Search the position after the reply the AI expects (the second move of its principal variation)
+        '''
+        self.ponder_move = None
+        if len(self.ai_pv) < 2 or self.ai_pv[0] != played:
+            return
+        # looked up in the turn's move map, built by next_turn
+        expected = Move.from_uci(self.ai_pv[1])
+        moves = self.board.legal_move_map(self.next_player).get((expected.initial.row, expected.initial.col), {})
+        reply = moves.get((expected.final.row, expected.final.col, expected.promotion))
+        if reply is None:
+            return
+        self.ponder_move = reply.uci()
+        self.board.make_move(reply)
+        fen = self.board.to_fen()
+        # the AI's side, to move after the reply
+        color = self.board.next_player
+        self.board.unmake_move()
+        print(f"Pondering on {self.ponder_move}")
+        engine.ponder(fen, color, max_depth=AI_MAX_DEPTH)
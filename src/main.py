@@ -3,8 +3,11 @@ import sys
 
 from const import *
 from game import Game
+from assets import assets
+from engine import engine
 from square import Square
 from move import Move
+from piece import Pawn
 
 class Main:
 
@@ -12,15 +15,25 @@ class Main:
         pygame.init()
         self.screen = pygame.display.set_mode( (WIDTH, HEIGHT) )
         pygame.display.set_caption('Chess')
+        # load and convert the piece images once, now that the display exists
+        assets.preload()
         self.game = Game()
         self.state = 'menu'  # Add state for menu or game
         self.ai_timer = 0  # Timer for AI delay
+        self.clock = pygame.time.Clock()
+        self.menu_dirty = True
+        self.caption = None
         self.pvp_button = pygame.Rect(WIDTH // 2 - 100, HEIGHT // 2, 200, 50)
         self.ai_button = pygame.Rect(WIDTH // 2 - 100, HEIGHT // 2 + 60, 200, 50)
+        # fonts are slow to create, so make them once
+        self.menu_font = pygame.font.SysFont('monospace', 36, bold=True)
+        self.title_font = pygame.font.SysFont('monospace', 48, bold=True)
+        self.subtitle_font = pygame.font.SysFont('monospace', 24)
+        self.hint_font = pygame.font.SysFont('monospace', 18)
 
     def show_menu(self, surface):
         surface.fill((0, 0, 0))  # Black background
-        font = pygame.font.SysFont('monospace', 36, bold=True)
+        font = self.menu_font
         title = font.render('ChessBot', True, (255, 255, 255))
         surface.blit(title, (WIDTH // 2 - title.get_width() // 2, HEIGHT // 4))
         
@@ -41,8 +54,8 @@ class Main:
         overlay.fill((0, 0, 0))
         surface.blit(overlay, (0, 0))
         
-        font = pygame.font.SysFont('monospace', 48, bold=True)
-        small_font = pygame.font.SysFont('monospace', 24)
+        font = self.title_font
+        small_font = self.subtitle_font
         
         if self.game.winner == 'draw':
             text = font.render('STALEMATE', True, (255, 255, 255))
@@ -60,11 +73,55 @@ class Main:
         surface.blit(subtext, subtext_rect)
         
         # Show restart instruction
-        restart_font = pygame.font.SysFont('monospace', 18)
+        restart_font = self.hint_font
         restart_text = restart_font.render('Press R to restart or ESC for menu', True, (150, 150, 150))
         restart_rect = restart_text.get_rect(center=(WIDTH // 2, HEIGHT - 50))
         surface.blit(restart_text, restart_rect)
 
+    def wait_events(self):
+        '''
+            Events for this frame. With nothing to redraw and no AI move pending the loop blocks here,
+            so an idle board uses no CPU; a pending AI move only waits until its timer is due,
+            and while the engine thinks the loop wakes up every frame to poll it
+        '''
+        busy = self.menu_dirty if self.state == 'menu' else self.game.needs_redraw()
+        if not busy:
+            if engine.thinking:
+                # keep polling the engine once a frame
+                event = pygame.event.wait(1000 // FPS)
+            elif self.ai_timer > 0:
+                event = pygame.event.wait(max(1, self.ai_timer - pygame.time.get_ticks()))
+            else:
+                event = pygame.event.wait()
+            return [event] + pygame.event.get()
+        return pygame.event.get()
+
+    def render(self, screen):
+        '''
+            Draw whatever changed and return the rects to push to the display
+        '''
+        if self.state == 'menu':
+            if not self.menu_dirty:
+                return []
+            self.menu_dirty = False
+            self.show_menu(screen)
+            return [screen.get_rect()]
+
+        game = self.game
+        # the translucent overlay can't be redrawn over part of the screen
+        if game.game_over and game.dirty_rects:
+            game.mark_dirty()
+        full_redraw = game.full_redraw
+        rects = game.render(screen)
+        if game.game_over and full_redraw:
+            self.show_game_over(screen)
+        return rects
+
+    def set_state(self, state):
+        self.state = state
+        self.menu_dirty = True
+        self.game.mark_dirty()
+
     def mainloop(self):
         
         screen = self.screen
@@ -75,46 +132,34 @@ class Main:
             board = self.game.board
             dragger = self.game.dragger
             
+            events = self.wait_events()
+
             if self.state == 'menu':
-                self.show_menu(screen)
-                for event in pygame.event.get():
+                for event in events:
                     if event.type == pygame.MOUSEBUTTONDOWN:
                         pos = event.pos
                         if self.pvp_button.collidepoint(pos):
                             game.ai_mode = False
-                            self.state = 'game'
+                            self.set_state('game')
                         elif self.ai_button.collidepoint(pos):
                             game.ai_mode = True
-                            self.state = 'game'
+                            self.set_state('game')
                     elif event.type == pygame.KEYDOWN:
                         if event.key == pygame.K_p:
                             game.ai_mode = False
-                            self.state = 'game'
+                            self.set_state('game')
                         elif event.key == pygame.K_a:
                             game.ai_mode = True
-                            self.state = 'game'
+                            self.set_state('game')
                     elif event.type == pygame.QUIT:
+                        engine.quit()
                         pygame.quit()
                         sys.exit()
             else:
-                # show methods
-                game.show_bg(screen)
-                game.show_last_move(screen)
-                game.show_moves(screen)
-                game.show_pieces(screen)
-                game.show_hover(screen)
-
-                # Show game over message if game is over
-                if game.game_over:
-                    self.show_game_over(screen)
-
-                if dragger.dragging:
-                    dragger.update_blit(screen)
-
-                for event in pygame.event.get():
+                for event in events:
 
                     # click
-                    if event.type == pygame.MOUSEBUTTONDOWN and not game.game_over:
+                    if event.type == pygame.MOUSEBUTTONDOWN and not game.game_over and not engine.thinking:
                         dragger.update_mouse(event.pos)
 
                         clicked_row = dragger.mouseY // SQSIZE
@@ -123,16 +168,12 @@ class Main:
                         # if clicked square has a piece ?
                         if board.squares[clicked_row][clicked_col].has_piece():
                             piece = board.squares[clicked_row][clicked_col].piece
-                            # valid piece (color) ?
+                            # valid piece (color) ? its moves are in the board's move map, built at turn start
                             if piece.color == game.next_player:
-                                board.calc_moves(piece, clicked_row, clicked_col, bool=True)
                                 dragger.save_initial(event.pos)
                                 dragger.drag_piece(piece)
-                                # show methods 
-                                game.show_bg(screen)
-                                game.show_last_move(screen)
-                                game.show_moves(screen)
-                                game.show_pieces(screen)
+                                # move highlights appear all over the board
+                                game.mark_dirty()
                     
                     # mouse motion
                     elif event.type == pygame.MOUSEMOTION:
@@ -142,14 +183,10 @@ class Main:
                         game.set_hover(motion_row, motion_col)
 
                         if dragger.dragging:
+                            # redraw where the piece was and where it is now
+                            game.mark_dirty(dragger.rect())
                             dragger.update_mouse(event.pos)
-                            # show methods
-                            game.show_bg(screen)
-                            game.show_last_move(screen)
-                            game.show_moves(screen)
-                            game.show_pieces(screen)
-                            game.show_hover(screen)
-                            dragger.update_blit(screen)
+                            game.mark_dirty(dragger.rect())
                     
                     # click release
                     elif event.type == pygame.MOUSEBUTTONUP:
@@ -160,31 +197,31 @@ class Main:
                             released_row = dragger.mouseY // SQSIZE
                             released_col = dragger.mouseX // SQSIZE
 
-                            # create possible move
-                            initial = Square(dragger.initial_row, dragger.initial_col)
-                            final = Square(released_row, released_col)
-                            move = Move(initial, final)
-
-                            # valid move ?
-                            if board.valid_move(dragger.piece, move):
-                                # normal capture
-                                captured = board.squares[released_row][released_col].has_piece()
-                                board.move(dragger.piece, move)
-
-                                board.set_true_en_passant(dragger.piece)                            
-
-                                # sounds
-                                game.play_sound(captured)
-                                # show methods
-                                game.show_bg(screen)
-                                game.show_last_move(screen)
-                                game.show_pieces(screen)
-                                # next turn
-                                game.next_turn()
-                                if game.ai_mode:
-                                    self.ai_timer = pygame.time.get_ticks() + 500  # 0.5 second delay
+                            # dropped outside the board: the piece goes back
+                            if Square.in_range(released_row, released_col):
+                                # create possible move
+                                initial = Square.at(dragger.initial_row, dragger.initial_col)
+                                final = Square.at(released_row, released_col)
+                                move = Move(initial, final)
+                                # pawns dropped on the last rank promote to a queen
+                                if isinstance(dragger.piece, Pawn) and released_row in (0, ROWS - 1):
+                                    move.promotion = 'queen'
+
+                                # valid move ?
+                                if board.valid_move(dragger.piece, move):
+                                    # normal capture
+                                    captured = board.squares[released_row][released_col].has_piece()
+                                    board.move(dragger.piece, move)
+
+                                    # sounds
+                                    game.play_sound(captured)
+                                    # next turn
+                                    game.next_turn()
+                                    if game.ai_mode:
+                                        self.ai_timer = pygame.time.get_ticks() + 500  # 0.5 second delay
                         
-                        dragger.undrag_piece()
+                            dragger.undrag_piece()
+                            game.mark_dirty()
                     
                     # key press
                     elif event.type == pygame.KEYDOWN:
@@ -201,8 +238,8 @@ class Main:
                                     self.ai_timer = 0
                             # back to menu
                             elif event.key == pygame.K_ESCAPE:
-                                self.state = 'menu'
                                 game.reset()
+                                self.set_state('menu')
                                 self.ai_timer = 0
                         else:
                             # Normal game controls when game is not over
@@ -225,12 +262,13 @@ class Main:
                             
                             # back to menu
                             if event.key == pygame.K_ESCAPE:
-                                self.state = 'menu'
                                 game.reset()
+                                self.set_state('menu')
                                 self.ai_timer = 0
 
                     # quit application
                     elif event.type == pygame.QUIT:
+                        engine.quit()
                         pygame.quit()
                         sys.exit()
             
@@ -238,9 +276,18 @@ class Main:
             if self.ai_timer > 0 and pygame.time.get_ticks() > self.ai_timer and not game.game_over:
                 self.ai_timer = 0
                 game.make_ai_move()
+            game.update_ai()
             
-            pygame.display.set_caption(f'Chess - AI Mode: {"ON" if game.ai_mode else "OFF"}')
-            pygame.display.update()
+            caption = f'Chess - AI Mode: {"ON" if game.ai_mode else "OFF"}'
+            if caption != self.caption:
+                pygame.display.set_caption(caption)
+                self.caption = caption
+
+            rects = self.render(screen)
+            if rects:
+                pygame.display.update(rects)
+            # cap the frame rate while events keep coming in (dragging, hovering)
+            self.clock.tick(FPS)
 
 
 if __name__ == '__main__':
@@ -1,16 +1,67 @@
+from array import array
+
+from square import Square
+
+# Promotion piece codes (bits 12-14 of an encoded move)
+PROMOTION_CODES = {None: 0, 'knight': 1, 'bishop': 2, 'rook': 3, 'queen': 4}
+PROMOTION_NAMES = {code: name for name, code in PROMOTION_CODES.items()}
 
 class Move:
 
-    def __init__(self, initial, final):
+    __slots__ = ('initial', 'final', 'promotion')
+
+    def __init__(self, initial, final, promotion=None):
         # initial and final are squares
         self.initial = initial
         self.final = final
+        # name of the piece a pawn promotes to (None = not a promotion, or a queen by default)
+        self.promotion = promotion
 
     def __str__(self):
         s = ''
         s += f'({self.initial.col}, {self.initial.row})'
         s += f' -> ({self.final.col}, {self.final.row})'
+        if self.promotion:
+            s += f' = {self.promotion}'
         return s
 
     def __eq__(self, other):
-        return self.initial == other.initial and self.final == other.final
\ No newline at end of file
+        return self.initial == other.initial and self.final == other.final and self.promotion == other.promotion
+
+    def encode(self):
+        # compact code: from_square << 6 | to_square, promotion piece in bits 12-14
+        return PROMOTION_CODES[self.promotion] << 12 | \
+               ((self.initial.row * 8 + self.initial.col) << 6) | (self.final.row * 8 + self.final.col)
+
+    def uci(self):
+        # long algebraic notation, e.g. e2e4 or e7e8q
+        s = f'{self.initial.alphacol}{8 - self.initial.row}{self.final.alphacol}{8 - self.final.row}'
+        if self.promotion:
+            s += 'n' if self.promotion == 'knight' else self.promotion[0]
+        return s
+
+    @staticmethod
+    def from_uci(text):
+        # inverse of uci()
+        initial = Square.at(8 - int(text[1]), Square.get_col(text[0]))
+        final = Square.at(8 - int(text[3]), Square.get_col(text[2]))
+        promotion = {'q': 'queen', 'r': 'rook', 'b': 'bishop', 'n': 'knight'}.get(text[4:])
+        return Move(initial, final, promotion)
+
+    @staticmethod
+    def decode(code):
+        # inverse of encode(), on the shared coordinate squares
+        return Move(Square.at(code >> 9 & 7, code >> 6 & 7), Square.at(code >> 3 & 7, code & 7),
+                    PROMOTION_NAMES[code >> 12])
+
+def encode_moves(moves):
+    '''
+        Packed move list: one unsigned 16-bit code per move (see Move.encode), 2 bytes a move
+    '''
+    return array('H', [move.encode() for move in moves])
+
+def decode_moves(codes):
+    '''
+        Move objects of a packed move list, for the GUI
+    '''
+    return [Move.decode(code) for code in codes]
@@ -0,0 +1,244 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from const import *
+from move import Move
+
+# Worker process state, set up once by _init_worker
+_shared_alpha = None
+_shared_stop = None
+_search_id = None
+
+class _SharedFlag:
+    '''
+        Stop token backed by a shared value, so one write in the parent stops every worker
+    '''
+
+    def __init__(self, value):
+        self.value = value
+
+    def is_set(self):
+        return bool(self.value.value)
+
+def _init_worker(shared_alpha, shared_stop):
+    global _shared_alpha, _shared_stop
+    _shared_alpha = shared_alpha
+    _shared_stop = _SharedFlag(shared_stop)
+
+def _search_root_move(search_id, fen, color, move_uci, depth, pv, deadline):
+    '''
+        Score one root move to the given depth in a worker process, stopping at deadline, a time.time() value
+        shared by every task of the iteration however long the task waited in the queue.
+        The search window starts at the best score any worker has found for this iteration so far,
+        so a move that can't beat it is refuted as cheaply as in the sequential search.
+        Returns (move, score, pv, failed_low) or None if the search ran out of time or was stopped
+    '''
+    global _search_id
+    from ai import minimax, get_principal_variation, transposition_table, clear_heuristics, search_board, \
+        SearchTimeout
+
+    # every worker keeps its transposition table across tasks, aged once per search
+    if search_id != _search_id:
+        _search_id = search_id
+        transposition_table.new_search()
+        clear_heuristics()
+
+    board = search_board(fen)
+    move = next(m for m in board.legal_moves(color) if m.uci() == move_uci)
+    board.make_move(move)
+    opponent = 'white' if color == 'black' else 'black'
+    alpha = _shared_alpha.value
+    try:
+        score, _ = minimax(board, depth - 1, alpha, float('inf'), False, color, ply=1, pv=pv,
+                           deadline=time.perf_counter() + (deadline - time.time()), stop=_shared_stop)
+    except SearchTimeout:
+        return None
+
+    # a fail-low score is only an upper bound, it can't raise alpha
+    failed_low = score <= alpha and alpha > -float('inf')
+    with _shared_alpha.get_lock():
+        if score > _shared_alpha.value:
+            _shared_alpha.value = score
+    line = [m.uci() for m in get_principal_variation(board, opponent, depth - 1)]
+    return move_uci, score, [move_uci] + line, failed_low
+
+class RootSearchPool:
+    '''
+        Process pool that searches the root moves of a position in parallel.
+        Started once and reused for every move of the session
+    '''
+
+    def __init__(self, workers=AI_WORKERS):
+        self.workers = workers
+        self.executor = None
+        self.search_id = 0
+
+    def start(self):
+        if self.executor:
+            return
+        # spawn: workers must not inherit the pygame state of the process that forks them
+        context = multiprocessing.get_context('spawn')
+        # best root score found so far in the current iteration, and the abort signal
+        self.alpha = context.Value('d', -float('inf'))
+        self.stop_flag = context.Value('b', 0, lock=False)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                            initializer=_init_worker, initargs=(self.alpha, self.stop_flag))
+
+    def shutdown(self):
+        if self.executor:
+            self.stop_flag.value = 1
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def search(self, board, color, time_ms=AI_TIME_MS, max_depth=AI_MAX_DEPTH, on_iteration=None, stop=None,
+               workers=None):
+        '''
+            Iterative deepening like ai.get_best_move, with the root moves of every iteration split across
+            the pool. The first move (the previous best) is searched alone to set alpha for the others
+        '''
+        from ai import get_all_moves, iterative_deepening
+
+        if workers and workers != self.workers:
+            self.shutdown()
+            self.workers = workers
+        self.start()
+        self.search_id += 1
+        fen = board.to_fen()
+        moves = [move.uci() for move in get_all_moves(board, color)]
+        pv = []
+
+        def search(depth, deadline):
+            nonlocal moves, pv
+            if not moves:
+                return None
+            self.alpha.value = -float('inf')
+            self.stop_flag.value = 0
+            # the workers' clock: the same deadline as time.time(), which every process can compare against
+            wall_deadline = time.time() + (deadline - time.perf_counter()) if deadline else float('inf')
+
+            first = self._run(moves[:1], fen, color, depth, pv, wall_deadline, stop)
+            if first is None:
+                return None
+            rest = self._run(moves[1:], fen, color, depth, [], wall_deadline, stop)
+            if rest is None:
+                return None
+
+            # best first; among equal scores exact ones before fail-lows, then the previous order
+            order = {uci: i for i, uci in enumerate(moves)}
+            results = sorted(first + rest, key=lambda result: (-result[1], result[3], order[result[0]]))
+            moves = [uci for uci, _, _, _ in results]
+            best_uci, best_score, pv_uci, _ = results[0]
+            best_move = next(m for m in get_all_moves(board, color) if m.uci() == best_uci)
+            pv = [Move.from_uci(uci).encode() for uci in pv_uci]
+            return best_score, best_move, [Move.from_uci(uci) for uci in pv_uci]
+
+        return iterative_deepening(search, time_ms, max_depth, on_iteration)
+
+    def _run(self, moves, fen, color, depth, pv, deadline, stop):
+        '''
+            Search the given root moves in the pool until deadline (a time.time() value).
+            Returns their (move, score, pv, failed_low) or None if interrupted
+        '''
+        futures = {self.executor.submit(_search_root_move, self.search_id, fen, color, uci, depth, pv, deadline)
+                   for uci in moves}
+        results = []
+        while futures:
+            done, futures = wait(futures, timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is None:
+                    self.stop_flag.value = 1
+                    wait(futures)
+                    return None
+                results.append(result)
+            if (stop and stop.is_set()) or time.time() > deadline:
+                self.stop_flag.value = 1
+                wait(futures)
+                return None
+        return results
+
+def _init_helper(table, shared_stop):
+    import ai
+    global _shared_stop
+    # probe and store through the shared table instead of this process's own
+    ai.transposition_table = table
+    _shared_stop = _SharedFlag(shared_stop)
+
+def _helper_search(fen, color, max_depth, start_depth):
+    '''
+        Lazy-SMP helper: deepen the same position as the main search until stopped, only to fill the shared table.
+        The table's age is left to the main search
+    '''
+    from ai import minimax, clear_heuristics, search_board, SearchTimeout
+
+    clear_heuristics()
+    board = search_board(fen)
+    for depth in range(start_depth, max_depth + 1):
+        try:
+            minimax(board, depth, -float('inf'), float('inf'), True, color, stop=_shared_stop)
+        except SearchTimeout:
+            break
+
+class LazySMPPool:
+    '''
+        Lazy SMP: helper processes search the same position as the main search, at staggered depths,
+        sharing one SharedTranspositionTable. The main search finds their results in the table and
+        finishes its iterations sooner. Started once and reused for every move of the session
+    '''
+
+    def __init__(self, workers=AI_WORKERS):
+        self.workers = workers
+        self.executor = None
+        self.table = None
+
+    def start(self):
+        if self.executor:
+            return
+        import ai
+        from transposition import SharedTranspositionTable
+
+        context = multiprocessing.get_context('spawn')
+        self.table = SharedTranspositionTable()
+        self.stop_flag = context.Value('b', 0, lock=False)
+        # the main search runs in this process, the helpers in the pool
+        self.local_table = ai.transposition_table
+        ai.transposition_table = self.table
+        self.executor = ProcessPoolExecutor(max_workers=max(1, self.workers - 1), mp_context=context,
+                                            initializer=_init_helper, initargs=(self.table, self.stop_flag))
+
+    def shutdown(self):
+        if self.executor:
+            import ai
+            self.stop_flag.value = 1
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+            ai.transposition_table = self.local_table
+            self.table.close()
+            self.table = None
+
+    def search(self, board, color, time_ms=AI_TIME_MS, max_depth=AI_MAX_DEPTH, on_iteration=None, stop=None,
+               workers=None):
+        '''
+            ai.get_best_move in this process, with workers - 1 helpers searching alongside it.
+            Odd helpers start one ply deeper, so the helpers don't all finish the same iterations together
+        '''
+        from ai import get_best_move
+
+        if workers and workers != self.workers:
+            self.shutdown()
+            self.workers = workers
+        self.start()
+        fen = board.to_fen()
+        self.stop_flag.value = 0
+        helpers = [self.executor.submit(_helper_search, fen, color, max_depth, 1 + i % 2)
+                   for i in range(self.workers - 1)]
+        try:
+            return get_best_move(board, color, time_ms, max_depth, on_iteration, stop, workers=1, use_book=False)
+        finally:
+            self.stop_flag.value = 1
+            wait(helpers)
+
+# Started on first use and shared by every search of the session
+root_pool = RootSearchPool()
+smp_pool = LazySMPPool()
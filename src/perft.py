@@ -0,0 +1,331 @@
+'''
+    Perft and benchmark harness.
+
+    Run from the src folder:
+        python -m perft                                   # reference suite on Board
+        python -m perft --backend bitboard --max-nodes 5000000
+        python -m perft --fen "<fen>" --depth 4 --divide  # divide counts for one position
+        python -m perft --position kiwipete --depth 3 --divide
+        python -m perft --compare --depth 3               # Board vs BitBoard equivalence
+        python -m perft --search --search-depth 4         # search smoke test on promotion/cutoff positions
+        python -m perft --bench --json results.json       # search/eval timings, written as JSON
+        python -m perft --speedup 8 --search-depth 4      # parallel root search time for 1, 2, 4, 8 workers
+        python -m perft --speedup 8 --parallel lazy-smp   # the same for Lazy SMP on a shared table
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+from board import Board
+from bitboard import BitBoard
+
+BACKENDS = {'board': Board, 'bitboard': BitBoard}
+
+# Reference positions and their known node counts by depth
+REFERENCE_POSITIONS = {
+    'startpos': ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+                 {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    'kiwipete': ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                 {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    'position3': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+                  {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    'position4': ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+                  {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    'position5': ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+                  {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    'position6': ('r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+                  {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    # en passant and castling edge cases
+    'illegal-ep-1': ('3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1',
+                     {1: 18, 2: 92, 3: 1670, 4: 10138, 5: 185429, 6: 1134888}),
+    'illegal-ep-2': ('8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1',
+                     {1: 13, 2: 102, 3: 1266, 4: 10276, 5: 135655, 6: 1015133}),
+    'ep-gives-check': ('8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1',
+                       {1: 15, 2: 126, 3: 1928, 4: 13931, 5: 206379, 6: 1440467}),
+    'short-castle-check': ('5k2/8/8/8/8/8/8/4K2R w K - 0 1',
+                           {1: 15, 2: 66, 3: 1198, 4: 6399, 5: 120330, 6: 661072}),
+    'long-castle-check': ('3k4/8/8/8/8/8/8/R3K3 w Q - 0 1',
+                          {1: 16, 2: 71, 3: 1286, 4: 7418, 5: 141077, 6: 803711}),
+    'castle-rights': ('r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1',
+                      {1: 26, 2: 1141, 3: 27826, 4: 1274206}),
+    'castling-prevented': ('r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1',
+                           {1: 44, 2: 1494, 3: 50509, 4: 1720476}),
+    'promote-out-of-check': ('2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1',
+                             {1: 11, 2: 133, 3: 1442, 4: 19174, 5: 266199, 6: 3821001}),
+    'discovered-check': ('8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1',
+                         {1: 29, 2: 165, 3: 5160, 4: 31961, 5: 1004658}),
+    'underpromote-check': ('8/P1k5/K7/8/8/8/8/8 w - - 0 1',
+                           {1: 6, 2: 27, 3: 273, 4: 1329, 5: 18135, 6: 92683}),
+    'self-stalemate': ('K1k5/8/P7/8/8/8/8/8 w - - 0 1',
+                       {1: 2, 2: 6, 3: 13, 4: 63, 5: 382, 6: 2217}),
+    'stalemate-checkmate': ('8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1',
+                            {1: 37, 2: 183, 3: 6559, 4: 23527}),
+}
+
+# Fixed positions for the evaluation and search timings
+BENCH_POSITIONS = ['startpos', 'kiwipete', 'position3', 'position4', 'position6']
+
+# Positions for the search smoke test: quiet promotions cause beta cutoffs, which update the killer and
+# history tables with the promotion bits of the move code set. Perft never reaches that code
+SEARCH_POSITIONS = {
+    'quiet-promotion': '4k3/1P6/8/8/8/8/8/4K3 b - - 0 1',
+    'promotion-race': '4r1k1/1P3p1p/1p1Bp3/p2n2p1/3P4/2Pp1N2/PP1N1PPP/R2Q1RK1 w - - 0 1',
+    'underpromote-check': REFERENCE_POSITIONS['underpromote-check'][0],
+    'position4': REFERENCE_POSITIONS['position4'][0],
+}
+
+def perft(board, depth):
+    '''
+        Number of leaf nodes of the legal move tree, through the move interface shared by Board and BitBoard
+    '''
+    if depth == 0:
+        return 1
+    moves = board.legal_moves(board.next_player)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+def divide(board, depth):
+    '''
+        Perft count below every root move, as {uci move: nodes}
+    '''
+    counts = {}
+    for move in board.legal_moves(board.next_player):
+        board.make_move(move)
+        counts[move.uci()] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+def compare(fen, depth):
+    '''
+        Check that Board and BitBoard agree on every perft count (and hash) down to depth
+    '''
+    board = Board(fen)
+    bitboard = BitBoard(fen)
+    if board.hash != bitboard.hash:
+        return False
+    for d in range(1, depth + 1):
+        if perft(board, d) != perft(bitboard, d):
+            return False
+    return True
+
+def run_perft(backend, fen, depth, expected=None):
+    board = BACKENDS[backend](fen)
+    start = time.perf_counter()
+    nodes = perft(board, depth)
+    seconds = time.perf_counter() - start
+    return {
+        'fen': fen,
+        'depth': depth,
+        'nodes': nodes,
+        'expected': expected,
+        'ok': expected is None or nodes == expected,
+        'seconds': round(seconds, 4),
+        'nps': int(nodes / seconds) if seconds else 0,
+    }
+
+def run_suite(backend, max_depth, max_nodes):
+    '''
+        Every reference position at its deepest known depth within max_depth and max_nodes
+    '''
+    results = {}
+    for name, (fen, counts) in REFERENCE_POSITIONS.items():
+        depths = [d for d, n in counts.items() if d <= max_depth and n <= max_nodes]
+        if not depths:
+            continue
+        depth = max(depths)
+        result = run_perft(backend, fen, depth, counts[depth])
+        results[name] = result
+        print(f'{"ok  " if result["ok"] else "FAIL"} {name:22} depth {depth}  '
+              f'{result["nodes"]:>9} nodes  {result["seconds"]:8.2f}s  {result["nps"]:>8} nps')
+    return results
+
+def time_calls(function, seconds=0.5):
+    '''
+        Calls per second of function over about the given time
+    '''
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(100):
+            function()
+        calls += 100
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return int(calls / elapsed)
+
+def run_bench(backend, search_depth, seed):
+    '''
+        Timings of evaluate_board, is_in_check and get_best_move on fixed positions, with a seeded RNG
+    '''
+    import ai
+
+    results = {}
+    for name in BENCH_POSITIONS:
+        fen = REFERENCE_POSITIONS[name][0]
+        board = BACKENDS[backend](fen)
+        color = board.next_player
+
+        random.seed(seed)
+        ai.transposition_table.clear()
+        start = time.perf_counter()
+        move = ai.get_best_move(board, color, time_ms=10 ** 9, max_depth=search_depth, use_book=False)
+        search_seconds = time.perf_counter() - start
+
+        results[name] = {
+            'fen': fen,
+            'evaluate_board_per_sec': time_calls(lambda: ai.evaluate_board(board, color)),
+            'is_in_check_per_sec': time_calls(lambda: board.is_in_check(color)),
+            'get_best_move_depth': search_depth,
+            'get_best_move_seconds': round(search_seconds, 4),
+            'best_move': move.uci() if move else None,
+        }
+        print(f'{name:12} eval {results[name]["evaluate_board_per_sec"]:>9}/s  '
+              f'in_check {results[name]["is_in_check_per_sec"]:>8}/s  '
+              f'search d{search_depth} {search_seconds:7.2f}s  {results[name]["best_move"]}')
+    return results
+
+def run_search_check(backend, search_depth, seed):
+    '''
+        get_best_move to a fixed depth on every search position; ok when it returns a legal move without raising
+    '''
+    import ai
+
+    results = {}
+    for name, fen in SEARCH_POSITIONS.items():
+        board = BACKENDS[backend](fen)
+        color = board.next_player
+        random.seed(seed)
+        ai.transposition_table.clear()
+        try:
+            move = ai.get_best_move(board, color, time_ms=10 ** 9, max_depth=search_depth,
+                                    use_book=False, use_tablebases=False)
+            ok = move is not None and any(move == legal for legal in board.legal_moves(color))
+            result = move.uci() if move else None
+        except Exception as error:
+            ok, result = False, repr(error)
+        results[name] = {'fen': fen, 'depth': search_depth, 'best_move': result, 'ok': ok}
+        print(f'{"ok  " if ok else "FAIL"} {name:22} depth {search_depth}  {result}')
+    return results
+
+def run_speedup(max_workers, search_depth, seed, parallel='root'):
+    '''
+        Time of a fixed-depth get_best_move over the benchmark positions for 1, 2, 4 ... max_workers processes.
+        The pool is started before the clock runs, as it is once per session in the game
+    '''
+    import ai
+    from parallel import root_pool, smp_pool
+
+    pool = smp_pool if parallel == 'lazy-smp' else root_pool
+    counts = sorted({1, max_workers} | {2 ** i for i in range(1, max_workers.bit_length()) if 2 ** i < max_workers})
+    results = {}
+    for workers in counts:
+        if workers > 1:
+            pool.shutdown()
+            pool.workers = workers
+            pool.start()
+        seconds = 0
+        for name in BENCH_POSITIONS:
+            # the engine's backend for every worker count, as the pool's workers use it too
+            board = ai.search_board(REFERENCE_POSITIONS[name][0])
+            random.seed(seed)
+            ai.transposition_table.clear()
+            start = time.perf_counter()
+            ai.get_best_move(board, board.next_player, time_ms=10 ** 9, max_depth=search_depth,
+                             workers=workers, parallel=parallel, use_book=False)
+            seconds += time.perf_counter() - start
+        results[workers] = {'seconds': round(seconds, 4), 'speedup': round(results[1]['seconds'] / seconds, 2)
+                            if workers > 1 else 1.0}
+        print(f'{workers:3} workers  {seconds:8.2f}s  speedup {results[workers]["speedup"]:.2f}')
+    pool.shutdown()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='perft', description='Move generation perft and engine benchmarks')
+    parser.add_argument('--backend', choices=BACKENDS, default='board')
+    parser.add_argument('--fen', help='position to run instead of the reference suite')
+    parser.add_argument('--position', choices=REFERENCE_POSITIONS, help='reference position to run')
+    parser.add_argument('--depth', type=int, default=None)
+    parser.add_argument('--divide', action='store_true', help='print the count below every root move')
+    parser.add_argument('--max-nodes', type=int, default=250000, help='suite: skip depths with more nodes')
+    parser.add_argument('--compare', action='store_true', help='check Board and BitBoard agree on the suite')
+    parser.add_argument('--bench', action='store_true', help='time evaluation, check detection and search')
+    parser.add_argument('--search', action='store_true', help='search smoke test on the search positions')
+    parser.add_argument('--speedup', type=int, metavar='WORKERS', help='time parallel root search up to WORKERS')
+    parser.add_argument('--parallel', choices=['root', 'lazy-smp'], default='root', help='speedup: parallel search mode')
+    parser.add_argument('--search-depth', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = {
+        'backend': args.backend,
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+    if args.compare:
+        depth = args.depth or 3
+        results['compare'] = {}
+        for name, (fen, counts) in REFERENCE_POSITIONS.items():
+            ok = compare(fen, min(depth, max(counts)))
+            results['compare'][name] = ok
+            print(f'{"ok  " if ok else "FAIL"} {name}')
+
+    elif args.fen or args.position:
+        fen, counts = (args.fen, {}) if args.fen else REFERENCE_POSITIONS[args.position]
+        depth = args.depth or 3
+        if args.divide:
+            board = BACKENDS[args.backend](fen)
+            start = time.perf_counter()
+            counts_by_move = divide(board, depth)
+            seconds = time.perf_counter() - start
+            for move, nodes in sorted(counts_by_move.items()):
+                print(f'{move}: {nodes}')
+            nodes = sum(counts_by_move.values())
+            results['divide'] = counts_by_move
+            results['perft'] = {'fen': fen, 'depth': depth, 'nodes': nodes, 'expected': counts.get(depth),
+                                'seconds': round(seconds, 4), 'nps': int(nodes / seconds) if seconds else 0}
+        else:
+            results['perft'] = run_perft(args.backend, fen, depth, counts.get(depth))
+        perft_result = results['perft']
+        print(f'\nNodes: {perft_result["nodes"]}' +
+              (f' (expected {perft_result["expected"]})' if perft_result['expected'] else ''))
+        print(f'Time: {perft_result["seconds"]:.2f}s  ({perft_result["nps"]} nodes/sec)')
+
+    elif args.search:
+        results['search'] = run_search_check(args.backend, args.search_depth, args.seed)
+
+    elif args.speedup:
+        results['cpu_count'] = os.cpu_count()
+        results['speedup'] = run_speedup(args.speedup, args.search_depth, args.seed, args.parallel)
+
+    elif not args.bench:
+        results['suite'] = run_suite(args.backend, args.depth or 99, args.max_nodes)
+
+    if args.bench:
+        results['bench'] = run_bench(args.backend, args.search_depth, args.seed)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results written to {args.json}')
+
+    failed = [name for name, r in results.get('suite', {}).items() if not r['ok']]
+    failed += [name for name, ok in results.get('compare', {}).items() if not ok]
+    failed += [name for name, r in results.get('search', {}).items() if not r['ok']]
+    if results.get('perft') and results['perft'].get('expected') not in (None, results['perft']['nodes']):
+        failed.append('perft')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
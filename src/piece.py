@@ -1,24 +1,17 @@
-import os
-
 class Piece:
 
-    def __init__(self, name, color, value, texture=None, texture_rect=None):
+    # no per-instance __dict__; images are looked up by color and name in assets.py, not stored per piece
+    __slots__ = ('name', 'color', 'value', 'moves', 'moved', 'texture_rect')
+
+    def __init__(self, name, color, value, texture_rect=None):
         self.name = name
         self.color = color
         value_sign = 1 if color == 'white' else -1
         self.value = value * value_sign
         self.moves = []
         self.moved = False
-        self.texture = texture
-        self.set_texture()
         self.texture_rect = texture_rect
 
-    def set_texture(self, size=80):
-        # Use absolute path based on this file's location
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.texture = os.path.join(
-            base_dir, 'assets', 'images', f'imgs-{size}px', f'{self.color}_{self.name}.png')
-
     def add_move(self, move):
         self.moves.append(move)
 
@@ -27,6 +20,8 @@ class Piece:
 
 class Pawn(Piece):
 
+    __slots__ = ('dir', 'en_passant')
+
     def __init__(self, color):
         self.dir = -1 if color == 'white' else 1
         self.en_passant = False
@@ -34,27 +29,37 @@ class Pawn(Piece):
 
 class Knight(Piece):
 
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('knight', color, 3.0)
 
 class Bishop(Piece):
 
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('bishop', color, 3.001)
 
 class Rook(Piece):
 
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('rook', color, 5.0)
 
 class Queen(Piece):
 
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('queen', color, 9.0)
 
 class King(Piece):
 
+    __slots__ = ('left_rook', 'right_rook')
+
     def __init__(self, color):
         self.left_rook = None
         self.right_rook = None
-        super().__init__('king', color, 10000.0)
\ No newline at end of file
+        super().__init__('king', color, 10000.0)
@@ -3,6 +3,8 @@ class Square:
 
     ALPHACOLS = {0: 'a', 1: 'b', 2: 'c', 3: 'd', 4: 'e', 5: 'f', 6: 'g', 7: 'h'}
 
+    __slots__ = ('row', 'col', 'piece', 'alphacol')
+
     def __init__(self, row, col, piece=None):
         self.row = row
         self.col = col
@@ -27,6 +29,14 @@ class Square:
     def isempty_or_enemy(self, color):
         return self.isempty() or self.has_enemy_piece(color)
 
+    @staticmethod
+    def at(row, col):
+        '''
+            Shared square for a move's coordinates, one per board square (never give it a piece).
+            Coordinates are not checked, so off-board ones (see in_range) must be rejected first
+        '''
+        return COORDINATES[row * 8 + col]
+
     @staticmethod
     def in_range(*args):
         for arg in args:
@@ -38,4 +48,11 @@ class Square:
     @staticmethod
     def get_alphacol(col):
         ALPHACOLS = {0: 'a', 1: 'b', 2: 'c', 3: 'd', 4: 'e', 5: 'f', 6: 'g', 7: 'h'}
-        return ALPHACOLS[col]
\ No newline at end of file
+        return ALPHACOLS[col]
+
+    @staticmethod
+    def get_col(alphacol):
+        return 'abcdefgh'.index(alphacol)
+
+# Flyweight coordinate squares used by moves, so generating a move allocates no squares
+COORDINATES = [Square(sq // 8, sq % 8) for sq in range(64)]
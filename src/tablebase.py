@@ -0,0 +1,374 @@
+'''
+    Endgame tablebases: distance to mate for king and one or two pieces against a lone king.
+
+    A table holds one byte per position for each side to move, indexed by the squares of the white king,
+    the black king and the white pieces (row * 8 + col, like Board): 0 is a draw, 1..127 a win for the
+    side to move in that many plies, and 129..255 a loss in 255 - value plies (255 = checkmated).
+    The stronger side is always white in the file; positions where black has the pieces are mirrored.
+
+    Generate the tables offline from the src folder (KPK needs KQK and KRK, so build in this order):
+        python -m tablebase generate KQK KRK KPK KBNK
+        python -m tablebase probe "<fen>"
+'''
+import argparse
+import itertools
+import mmap
+import os
+import sys
+import time
+
+from const import *
+from bitboard import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, WHITE, rook_attacks, bishop_attacks
+
+# Pieces of the stronger side of each table, in index order
+TABLES = {
+    'KQK': ['queen'],
+    'KRK': ['rook'],
+    'KPK': ['pawn'],
+    'KBNK': ['bishop', 'knight'],
+}
+
+# Pieces that can't mate a lone king on their own
+INSUFFICIENT = [[], ['bishop'], ['knight']]
+
+# Most pieces in any table, kings included
+MAX_PIECES = 4
+
+# Marker for impossible positions while generating, written out as a draw
+ILLEGAL = 128
+
+# Score of a won position for the evaluation, minus the plies to mate, so faster mates score higher
+WIN_SCORE = 50000
+
+def _attacks(name, sq, occupied):
+    if name == 'queen':
+        return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+    if name == 'rook':
+        return rook_attacks(sq, occupied)
+    if name == 'bishop':
+        return bishop_attacks(sq, occupied)
+    if name == 'knight':
+        return KNIGHT_ATTACKS[sq]
+    if name == 'pawn':
+        return PAWN_ATTACKS[WHITE][sq]
+    return KING_ATTACKS[sq]
+
+def _bits(bb):
+    squares = []
+    while bb:
+        low = bb & -bb
+        squares.append(low.bit_length() - 1)
+        bb ^= low
+    return squares
+
+def _index(wk, bk, squares):
+    index = wk * 64 + bk
+    for sq in squares:
+        index = index * 64 + sq
+    return index
+
+def _squares(index, count):
+    squares = []
+    for _ in range(count):
+        index, sq = divmod(index, 64)
+        squares.append(sq)
+    bk = index % 64
+    return index // 64, bk, squares[::-1]
+
+def loss(plies):
+    return 255 - plies
+
+def value_plies(value):
+    '''
+        (result for the side to move, plies to mate) of a table value; result is 1 win, 0 draw, -1 loss
+    '''
+    if value == 0:
+        return 0, 0
+    if value < ILLEGAL:
+        return 1, value
+    return -1, 255 - value
+
+# Generation
+
+def generate(name, out_dir, verbose=True):
+    '''
+        Solve a table by retrograde analysis and write it to out_dir/<name>.tb
+    '''
+    pieces = TABLES[name]
+    count = len(pieces)
+    size = 64 ** (2 + count)
+    start = time.perf_counter()
+
+    wtm = bytearray([ILLEGAL]) * size
+    btm = bytearray(size)
+    # legal moves black has left that don't lose; 255 once black can reach a draw
+    counts = bytearray(size)
+    mates = []
+    # wins that leave the table by promotion, by plies to mate
+    seeds = {}
+    promotion_tables = {}
+    if 'pawn' in pieces:
+        for promoted in ('KQK', 'KRK'):
+            with open(os.path.join(out_dir, promoted + '.tb'), 'rb') as f:
+                promotion_tables[promoted] = f.read()
+
+    for wk in range(64):
+        for bk in range(64):
+            if bk == wk or KING_ATTACKS[wk] >> bk & 1:
+                continue
+            for squares in itertools.product(range(64), repeat=count):
+                if len(set(squares)) < count or wk in squares or bk in squares:
+                    continue
+                if any(name == 'pawn' and sq // 8 in (0, 7) for name, sq in zip(pieces, squares)):
+                    continue
+                index = _index(wk, bk, squares)
+                white = 1 << wk
+                for sq in squares:
+                    white |= 1 << sq
+                # attacks seen by the black king, which doesn't block lines through its own square
+                attacked = KING_ATTACKS[wk]
+                for piece, sq in zip(pieces, squares):
+                    attacked |= _attacks(piece, sq, white)
+                in_check = attacked >> bk & 1
+
+                # white to move: only legal if black isn't in check
+                if not in_check:
+                    wtm[index] = 0
+                    if 'pawn' in pieces:
+                        _seed_promotion(pieces, wk, bk, squares, white, promotion_tables, seeds, index)
+
+                # black to move
+                moves = KING_ATTACKS[bk] & ~attacked
+                if moves & white:
+                    # an undefended piece can be taken, leaving a draw
+                    counts[index] = 255
+                elif moves:
+                    counts[index] = bin(moves).count('1')
+                elif in_check:
+                    btm[index] = loss(0)
+                    mates.append(index)
+                else:
+                    # stalemate
+                    counts[index] = 255
+
+    if verbose:
+        print(f'{name}: {len(mates)} mates, set up in {time.perf_counter() - start:.1f}s', flush=True)
+
+    plies = 0
+    frontier = mates
+    while frontier or any(level > plies for level in seeds):
+        won = []
+        for index in frontier:
+            for before in _white_unmoves(pieces, index):
+                if wtm[before] == 0:
+                    wtm[before] = plies + 1
+                    won.append(before)
+        for before in seeds.pop(plies + 1, []):
+            if wtm[before] == 0:
+                wtm[before] = plies + 1
+                won.append(before)
+
+        frontier = []
+        for index in won:
+            for before in _black_unmoves(pieces, index):
+                left = counts[before]
+                if 0 < left < 255:
+                    counts[before] = left - 1
+                    if left == 1:
+                        btm[before] = loss(plies + 2)
+                        frontier.append(before)
+        plies += 2
+        if verbose and (won or frontier):
+            print(f'{name}: {len(won)} wins in {plies - 1} plies, {len(frontier)} losses in {plies} plies', flush=True)
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, name + '.tb'), 'wb') as f:
+        f.write(wtm.translate(bytes(0 if v == ILLEGAL else v for v in range(256))))
+        f.write(btm)
+    if verbose:
+        print(f'{name}: written in {time.perf_counter() - start:.1f}s')
+
+def _seed_promotion(pieces, wk, bk, squares, white, promotion_tables, seeds, index):
+    '''
+        White to move in a pawn table: a promotion that leads to a lost position in the queen or rook
+        table is a win one ply later
+    '''
+    i = pieces.index('pawn')
+    sq = squares[i]
+    if sq // 8 != 1 or sq - 8 == bk or white >> (sq - 8) & 1:
+        return
+    best = None
+    for table in ('KQK', 'KRK'):
+        # those tables have exactly one piece, the promoted one
+        child = _index(wk, bk, [sq - 8])
+        result, plies = value_plies(promotion_tables[table][64 ** 3 + child])
+        if result < 0 and (best is None or plies + 1 < best):
+            best = plies + 1
+    if best is not None:
+        seeds.setdefault(best, []).append(index)
+
+def _white_unmoves(pieces, index):
+    '''
+        White to move positions that lead to this black to move position with one white move
+    '''
+    wk, bk, squares = _squares(index, len(pieces))
+    occupied = 1 << wk | 1 << bk
+    for sq in squares:
+        occupied |= 1 << sq
+
+    # king, not next to the black king
+    for sq in _bits(KING_ATTACKS[wk] & ~occupied & ~KING_ATTACKS[bk]):
+        yield _index(sq, bk, squares)
+
+    for i, (piece, sq) in enumerate(zip(pieces, squares)):
+        if piece == 'pawn':
+            froms = []
+            if sq // 8 < 6 and not occupied >> (sq + 8) & 1:
+                froms.append(sq + 8)
+                if sq // 8 == 4 and not occupied >> (sq + 16) & 1:
+                    froms.append(sq + 16)
+        else:
+            froms = _bits(_attacks(piece, sq, occupied) & ~occupied)
+        for before in froms:
+            yield _index(wk, bk, squares[:i] + [before] + squares[i + 1:])
+
+def _black_unmoves(pieces, index):
+    '''
+        Black to move positions that lead to this white to move position with one black king move
+    '''
+    wk, bk, squares = _squares(index, len(pieces))
+    occupied = 1 << wk
+    for sq in squares:
+        occupied |= 1 << sq
+    for sq in _bits(KING_ATTACKS[bk] & ~occupied & ~KING_ATTACKS[wk]):
+        yield _index(wk, sq, squares)
+
+# Probing
+
+class Tablebases:
+    '''
+        Memory-mapped tables found in a folder, opened on first use
+    '''
+
+    def __init__(self, path=AI_TABLEBASES):
+        self.path = path
+        self.tables = None
+
+    def _open(self):
+        self.tables = {}
+        for name in TABLES:
+            file = os.path.join(self.path, name + '.tb')
+            if os.path.exists(file):
+                with open(file, 'rb') as f:
+                    self.tables[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def available(self):
+        if self.tables is None:
+            self._open()
+        return bool(self.tables)
+
+    def probe(self, board):
+        '''
+            (result, plies to mate) for the side to move, result 1 win, 0 draw, -1 loss,
+            or None when the position isn't covered or can't occur (a king missing, the side not to move in check)
+        '''
+        if not self.available():
+            return None
+        material = {'white': [], 'black': []}
+        kings = {}
+        for row, col, name, color in board.pieces():
+            if name == 'king':
+                kings[color] = row * 8 + col
+            else:
+                material[color].append((name, row, col))
+
+        if material['black'] and material['white']:
+            return None
+        # impossible positions are stored as draws, so they must not be looked up
+        if len(kings) < 2 or board.is_in_check('white' if board.next_player == 'black' else 'black'):
+            return None
+        # the table's white side is the side with pieces, mirrored top to bottom when that is black
+        strong = 'black' if material['black'] else 'white'
+        weak = 'white' if strong == 'black' else 'black'
+        pieces = sorted(material[strong], key=lambda piece: ['queen', 'rook', 'bishop', 'knight', 'pawn'].index(piece[0]))
+        names = [name for name, _, _ in pieces]
+        if names in INSUFFICIENT:
+            return 0, 0
+        name = next((table for table, table_pieces in TABLES.items() if table_pieces == names), None)
+        if name not in self.tables:
+            return None
+
+        def square(sq):
+            return sq if strong == 'white' else (7 - sq // 8) * 8 + sq % 8
+
+        index = _index(square(kings[strong]), square(kings[weak]),
+                       [square(row * 8 + col) for _, row, col in pieces])
+        if board.next_player != strong:
+            index += 64 ** (2 + len(names))
+        return value_plies(self.tables[name][index])
+
+    def best_move(self, board, color):
+        '''
+            Fastest winning move, else a drawing move, else the slowest loss; None if not covered
+        '''
+        if self.probe(board) is None:
+            return None
+        best, best_key = None, None
+        for move in board.legal_moves(color):
+            board.make_move(move)
+            probed = self.probe(board)
+            board.unmake_move()
+            if probed is None:
+                return None
+            result, plies = probed
+            # the opponent's loss is our win: prefer short wins, then draws, then long losses
+            key = (-result, -plies if result < 0 else plies)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+    def score(self, board, color):
+        '''
+            Evaluation for color from the tables, or None when the position isn't covered
+        '''
+        probed = self.probe(board)
+        if probed is None:
+            return None
+        result, plies = probed
+        score = result * (WIN_SCORE - plies)
+        return score if board.next_player == color else -score
+
+# Shared by the search and the evaluation
+tablebases = Tablebases()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tablebase', description='Generate and probe endgame tablebases')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('generate', help='solve tables by retrograde analysis')
+    build.add_argument('tables', nargs='+', choices=TABLES)
+    build.add_argument('-o', '--output', default=AI_TABLEBASES)
+    probe = commands.add_parser('probe', help='look up a position')
+    probe.add_argument('fen')
+    probe.add_argument('--path', default=AI_TABLEBASES)
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        for name in args.tables:
+            generate(name, args.output)
+    else:
+        from bitboard import BitBoard
+        board = BitBoard(args.fen)
+        tables = Tablebases(args.path)
+        probed = tables.probe(board)
+        if probed is None:
+            print('not in the tablebases')
+        else:
+            result, plies = probed
+            print({1: f'win, mate in {plies} plies', 0: 'draw', -1: f'loss, mated in {plies} plies'}[result])
+            move = tables.best_move(board, board.next_player)
+            if move:
+                print(f'best move {move.uci()}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
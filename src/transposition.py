@@ -0,0 +1,204 @@
+from multiprocessing import shared_memory
+
+from const import TT_SIZE_MB
+
+# Bound types
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+class TranspositionTable:
+
+    # rough memory footprint of one stored entry (tuple + ints) in CPython
+    ENTRY_BYTES = 128
+
+    def __init__(self, size_mb=TT_SIZE_MB):
+        # power of two number of slots so the index is a simple mask
+        slots = max(1, size_mb * 1024 * 1024 // self.ENTRY_BYTES)
+        self.size = 1 << (slots.bit_length() - 1)
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """
+        Start a new search: older entries become preferred for replacement.
+        """
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        """
+        Return the (key, depth, score, bound, move, age) entry for key, or None.
+        """
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        """
+        Store a search result, replacing by depth and age.
+        """
+        index = key & self.mask
+        old = self.entries[index]
+        # keep a deeper result from the current search
+        if old is not None and old[5] == self.age and old[1] > depth:
+            return
+        # don't lose the best move of a position already in the table
+        if move is None and old is not None and old[0] == key:
+            move = old[4]
+        self.entries[index] = (key, depth, score, bound, move, self.age)
+        self.stores += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.probes = self.hits = self.stores = 0
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        """
+        Hit-rate statistics since the table was created or cleared.
+        """
+        return {
+            'size': self.size,
+            'probes': self.probes,
+            'hits': self.hits,
+            'stores': self.stores,
+            'hit_rate': round(self.hit_rate(), 3),
+        }
+
+class SharedTranspositionTable:
+    """
+    Transposition table in shared memory, probed and stored concurrently by several processes without locks.
+
+    Every slot is two 64-bit words: (key ^ data, data). A writer stores both words one after the other,
+    so a reader that sees half of one write and half of another gets a key that doesn't verify, and the
+    torn entry is treated as a miss instead of being trusted. The search age lives in the header, so all
+    processes age entries together. Pass the table to another process (it pickles by name) to attach to it.
+    """
+
+    ENTRY_BYTES = 16
+    HEADER_WORDS = 8
+
+    # data word layout: score (32 bits, offset by 2^31) | depth (8) | bound (2) | move (16) | age (6)
+    SCORE_OFFSET = 1 << 31
+    SCORE_LIMIT = (1 << 31) - 2
+    NO_MOVE = 0xFFFF
+
+    def __init__(self, size_mb=TT_SIZE_MB, name=None):
+        if name is None:
+            slots = max(1, size_mb * 1024 * 1024 // self.ENTRY_BYTES)
+            size = 1 << (slots.bit_length() - 1)
+            self.shm = shared_memory.SharedMemory(create=True, size=(self.HEADER_WORDS + 2 * size) * 8)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            size = (self.shm.size // 8 - self.HEADER_WORDS) // 2
+            size = 1 << (size.bit_length() - 1)
+            self.owner = False
+        self.name = self.shm.name
+        self.size = size
+        self.mask = size - 1
+        self.words = self.shm.buf.cast('Q')
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __reduce__(self):
+        return (SharedTranspositionTable, (None, self.name))
+
+    @property
+    def age(self):
+        return self.words[0]
+
+    def new_search(self):
+        """
+        Start a new search: older entries become preferred for replacement.
+        """
+        self.words[0] = (self.words[0] + 1) & 0x3F
+
+    def _unpack(self, key, data):
+        score = (data & 0xFFFFFFFF) - self.SCORE_OFFSET
+        if score > self.SCORE_LIMIT:
+            score = float('inf')
+        elif score < -self.SCORE_LIMIT:
+            score = -float('inf')
+        move = (data >> 42) & 0xFFFF
+        return (key, (data >> 32) & 0xFF, score, (data >> 40) & 0x3,
+                None if move == self.NO_MOVE else move, data >> 58)
+
+    def probe(self, key):
+        """
+        Return the (key, depth, score, bound, move, age) entry for key, or None.
+        """
+        self.probes += 1
+        index = self.HEADER_WORDS + 2 * (key & self.mask)
+        check, data = self.words[index], self.words[index + 1]
+        if check ^ data == key and data:
+            self.hits += 1
+            return self._unpack(key, data)
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        """
+        Store a search result, replacing by depth and age.
+        """
+        index = self.HEADER_WORDS + 2 * (key & self.mask)
+        check, data = self.words[index], self.words[index + 1]
+        age = self.words[0]
+        if data:
+            old_key = check ^ data
+            # keep a deeper result from the current search
+            if data >> 58 == age and (data >> 32) & 0xFF > depth:
+                return
+            # don't lose the best move of a position already in the table
+            if move is None and old_key == key:
+                old_move = (data >> 42) & 0xFFFF
+                move = None if old_move == self.NO_MOVE else old_move
+
+        score = max(-self.SCORE_LIMIT - 1, min(self.SCORE_LIMIT + 1, score))
+        data = (int(score) + self.SCORE_OFFSET) | min(depth, 0xFF) << 32 | bound << 40 | \
+               (self.NO_MOVE if move is None else move) << 42 | age << 58
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
+        self.stores += 1
+
+    def clear(self):
+        start = self.HEADER_WORDS * 8
+        self.shm.buf[start:] = bytes(self.shm.size - start)
+        self.probes = self.hits = self.stores = 0
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        """
+        Hit-rate statistics of this process since it attached or cleared the table.
+        """
+        return {
+            'size': self.size,
+            'probes': self.probes,
+            'hits': self.hits,
+            'stores': self.stores,
+            'hit_rate': round(self.hit_rate(), 3),
+        }
+
+    def close(self):
+        """
+        Detach from the shared memory; the process that created the table also frees it.
+        """
+        self.words.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __del__(self):
+        # the view must go before SharedMemory can unmap the buffer
+        self.words.release()
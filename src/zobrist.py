@@ -0,0 +1,35 @@
+import random
+
+# Fixed seed so every process (and every run) hashes positions the same way
+_rng = random.Random(0x5EED)
+
+def _key():
+    return _rng.getrandbits(64)
+
+# Piece placement keys, indexed as PIECE_KEYS[color][name][row * 8 + col]
+PIECE_KEYS = {
+    color: {
+        name: [_key() for _ in range(64)]
+        for name in ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+    }
+    for color in ('white', 'black')
+}
+
+# Castling rights keys: white kingside, white queenside, black kingside, black queenside
+CASTLING_KEYS = [_key() for _ in range(4)]
+
+# En passant file keys
+EN_PASSANT_KEYS = [_key() for _ in range(8)]
+
+# Toggled whenever black is to move
+SIDE_KEY = _key()
+
+def castling_key(rights):
+    """
+    Combined key for a 4-bit castling rights mask.
+    """
+    key = 0
+    for i in range(4):
+        if rights & (1 << i):
+            key ^= CASTLING_KEYS[i]
+    return key